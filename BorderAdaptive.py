@@ -0,0 +1,91 @@
+import statistics
+
+import numpy
+
+# Adaptive sweeps
+# ---------------
+# Instead of a fixed grid over one parameter (and a hand-picked re-sweep around the tipping point), an adaptive sweep
+# runs a coarse grid first. After every round, it scores the intervals between neighbouring values on how much the
+# outcome metric changes over the interval and how much it varies between iterations, and adds the midpoints of the
+# best scoring intervals. Intervals which are too narrow to split get more iterations (new runs with new seeds) at
+# both ends instead, so the budget keeps going to the region that needs it. This goes on until the run budget is spent.
+
+# Outcome metrics, computed from the data collector frame of a run
+METRICS = { "divergence": lambda run_frame: abs(run_frame["avg_sound_nl"].iloc[-1] - run_frame["avg_sound_be"].iloc[-1]) }
+
+# A metric is either one of METRICS or the name of a reporter (its value at the last step)
+def run_metric(run_frame, metric):
+	if metric in METRICS:
+		return float(METRICS[metric](run_frame))
+
+	return float(run_frame[metric].iloc[-1])
+
+# Score of the interval between every pair of neighbouring values: the change of the mean metric over the interval,
+# plus the mean standard deviation at both ends
+def interval_scores(point_metrics):
+	values = sorted(point_metrics)
+	means = [ statistics.mean(point_metrics[value]) for value in values ]
+	deviations = [ statistics.stdev(point_metrics[value]) if len(point_metrics[value]) > 1 else 0 for value in values ]
+
+	return [ (abs(means[i + 1] - means[i]) + (deviations[i] + deviations[i + 1]) / 2, values[i], values[i + 1]) \
+			 for i in range(len(values) - 1) ]
+
+# Runs to add for the best scoring intervals, as { value: number of runs }: the midpoint of an interval which is still
+# wide enough to split gets iterations runs, the ends of a narrower interval get half as many each
+def refinement_runs(point_metrics, refinements, iterations, min_spacing, remaining_runs):
+	scores = interval_scores(point_metrics)
+	scores.sort(reverse=True)
+
+	runs = {}
+	for score, low, high in scores[:refinements]:
+		if high - low >= 2 * min_spacing:
+			interval_runs = { (low + high) / 2: iterations }
+		else:
+			interval_runs = { low: (iterations + 1) // 2, high: (iterations + 1) // 2 }
+
+		if sum(interval_runs.values()) > remaining_runs:
+			continue
+		remaining_runs -= sum(interval_runs.values())
+
+		for value, count in interval_runs.items():
+			runs[value] = runs.get(value, 0) + count
+
+	return runs
+
+# run_values(points, first_run) runs every (value, first iteration, number of iterations) point, numbering the runs
+# from first_run, and returns (job, data collector frame) pairs, where the value of the job is
+# job["parameters"][parameter]
+def adaptive_sweep(run_values, parameter, low, high, coarse_points, iterations, budget, metric="divergence",
+				   refinements=2, min_spacing=None):
+	if min_spacing is None:
+		min_spacing = (high - low) / (coarse_points - 1) / 16
+
+	values = [ float(value) for value in numpy.linspace(low, high, coarse_points) ]
+	if len(values) * iterations > budget:
+		raise ValueError("The coarse grid alone needs {} runs, the budget is {}".format(len(values) * iterations, budget))
+
+	finished_runs = []
+	point_metrics = {}
+	point_iterations = {} # iterations scheduled for every value, finished or not
+	scheduled_runs = 0
+
+	runs = { value: iterations for value in values }
+	round_number = 0
+	while runs:
+		print("Adaptive round {}: {} = {}".format(round_number, parameter,
+												  ", ".join("{:.6g} ({} runs)".format(value, count) for value, count in sorted(runs.items()))))
+
+		points = [ (value, point_iterations.get(value, 0), count) for value, count in sorted(runs.items()) ]
+		for value, count in runs.items():
+			point_iterations[value] = point_iterations.get(value, 0) + count
+
+		for job, run_frame in run_values(points, scheduled_runs):
+			finished_runs.append((job, run_frame))
+			point_metrics.setdefault(float(job["parameters"][parameter]), []).append(run_metric(run_frame, metric))
+		scheduled_runs += sum(runs.values())
+
+		# Refine as far as the remaining budget allows
+		runs = refinement_runs(point_metrics, refinements, iterations, min_spacing, budget - scheduled_runs)
+		round_number += 1
+
+	return finished_runs
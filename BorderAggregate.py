@@ -0,0 +1,119 @@
+import json
+
+import numpy
+import pandas
+
+from BorderResults import canonical_value
+from BorderSweep import report_parameters
+
+# Streaming aggregation
+# ---------------------
+# Most analyses only need, per parameter set and step, the mean and spread of every reporter over the iterations.
+# RunAggregator folds every run into running statistics as soon as it finishes (Welford's algorithm, which stays
+# accurate where summing squares would not), so the runs themselves do not have to be kept. The summary report has
+# one row per parameter set and step: the parameters, the number of runs, and per reporter its mean, standard
+# deviation, 95% confidence interval of the mean, minimum and maximum.
+
+# Columns which differ between the iterations of a parameter set
+ITERATION_COLUMNS = [ "run", "seed" ]
+
+# Two-sided 95% quantiles of Student's t distribution for 1 - 30 degrees of freedom
+T_QUANTILES = [ 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+				2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042 ]
+
+def t_quantile(degrees_of_freedom):
+	if degrees_of_freedom < 1:
+		return numpy.nan
+	if degrees_of_freedom <= len(T_QUANTILES):
+		return T_QUANTILES[degrees_of_freedom - 1]
+
+	# Cornish-Fisher expansion around the normal quantile z up to the second order, within 0.0001 from 31 degrees of
+	# freedom on (the first order alone is 0.003 off at 31)
+	z = 1.959964
+	return z + (z ** 3 + z) / (4 * degrees_of_freedom) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * degrees_of_freedom ** 2)
+
+class RunningStatistics():
+	def __init__(self, steps, reporters):
+		self.steps = steps
+		self.reporters = reporters
+		self.count = numpy.zeros(len(steps), dtype=numpy.int64)
+		self.mean = numpy.zeros((len(steps), len(reporters)))
+		self.m2 = numpy.zeros((len(steps), len(reporters)))
+		self.minimum = numpy.full((len(steps), len(reporters)), numpy.inf)
+		self.maximum = numpy.full((len(steps), len(reporters)), -numpy.inf)
+
+	# Make room for steps which earlier runs did not have
+	def extend(self, steps):
+		all_steps = numpy.union1d(self.steps, steps)
+		positions = numpy.searchsorted(all_steps, self.steps)
+
+		extended = RunningStatistics(all_steps, self.reporters)
+		for name in [ "count", "mean", "m2", "minimum", "maximum" ]:
+			getattr(extended, name)[positions] = getattr(self, name)
+
+		return extended
+
+	def add(self, steps, values):
+		positions = numpy.searchsorted(self.steps, steps)
+
+		self.count[positions] += 1
+		delta = values - self.mean[positions]
+		self.mean[positions] += delta / self.count[positions, None]
+		self.m2[positions] += delta * (values - self.mean[positions])
+		self.minimum[positions] = numpy.minimum(self.minimum[positions], values)
+		self.maximum[positions] = numpy.maximum(self.maximum[positions], values)
+
+	def frame(self):
+		counts = self.count[:, None]
+		with numpy.errstate(invalid="ignore", divide="ignore"):
+			deviation = numpy.sqrt(numpy.where(counts > 1, self.m2 / (counts - 1), numpy.nan))
+			half_width = numpy.array([ t_quantile(count - 1) for count in self.count ])[:, None] * deviation / numpy.sqrt(counts)
+
+		columns = { "runs": self.count }
+		for i, reporter in enumerate(self.reporters):
+			columns[reporter + "_mean"] = self.mean[:, i]
+			columns[reporter + "_std"] = deviation[:, i]
+			columns[reporter + "_ci95"] = half_width[:, i]
+			columns[reporter + "_min"] = self.minimum[:, i]
+			columns[reporter + "_max"] = self.maximum[:, i]
+
+		return pandas.DataFrame(columns, index=pandas.Index(self.steps, name="step"))
+
+class RunAggregator():
+	def __init__(self):
+		# Parameter set key: [ lowest run number, report columns of the parameter set, running statistics ]
+		self.groups = {}
+
+	def add(self, job, run_frame):
+		parameters = [ (column, value) for column, value in report_parameters(job) if column not in ITERATION_COLUMNS ]
+		key = json.dumps([ (column, canonical_value(value)) for column, value in parameters ])
+
+		reporters = [ column for column in run_frame.columns if numpy.issubdtype(run_frame[column].dtype, numpy.number) ]
+		steps = run_frame.index.to_numpy()
+
+		if key not in self.groups:
+			self.groups[key] = [ job["run"], parameters, RunningStatistics(steps, reporters) ]
+
+		group = self.groups[key]
+		group[0] = min(group[0], job["run"])
+
+		if group[2].reporters != reporters:
+			raise ValueError("Runs of the same parameter set report different columns")
+		if not numpy.isin(steps, group[2].steps).all():
+			group[2] = group[2].extend(steps)
+
+		group[2].add(steps, run_frame[reporters].to_numpy(dtype=numpy.float64))
+
+	# One frame for all parameter sets, in the order of their runs (runs can finish in any order)
+	def frame(self):
+		frames = []
+		for first_run, parameters, statistics in sorted(self.groups.values(), key=lambda group: group[0]):
+			frame = statistics.frame()
+			for column, value in parameters:
+				frame[column] = value
+			frames.append(frame)
+
+		return pandas.concat(frames)
+
+	def write(self, filename):
+		self.frame().to_csv(filename, sep=";")
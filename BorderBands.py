@@ -0,0 +1,392 @@
+import bisect
+import fractions
+import math
+import multiprocessing
+import random
+import traceback
+import weakref
+
+from mesa import Agent
+from mesa.time import RandomActivation
+from mesa.space import MultiGrid
+from BorderModel import BorderModel, BorderAgent, THE_NETHERLANDS, BELGIUM
+
+# Domain-decomposed BorderModel
+# -----------------------------
+# The grid is cut into horizontal bands (rows [y0, y1)), and every band is simulated by its own process.
+# Each step goes through two exchanges with the coordinator (BandedBorderModel):
+#
+#   1. "step": every band receives the ghosts of the agents living in the rows just outside its band (the halo),
+#               the agents which migrated into the band and a pool of central sounds for media influence.
+#               It then steps its own agents. Conversations with ghosts are sent back to the coordinator.
+#   2. "finish": every band receives the conversations addressed to its agents and adopts them, decays
+#                the sound memories, reports partial statistics and hands over the agents which left the band.
+#
+# The coordinator combines the partial statistics, so the data collector reports the same series as the
+# single-process model. The runs are statistically equivalent, not identical: agents in different bands act
+# concurrently, ghosts are one step old and media sounds are sampled from the previous step.
+
+# How many central sounds are sampled per country each step for media influence
+CENTRAL_POOL_SIZE = 256
+
+# A read-only stand-in for an agent which lives in a neighbouring band
+class GhostAgent(Agent):
+	def __init__(self, unique_id, model, influence_sphere, band):
+		super().__init__(unique_id, model)
+		self.influence_sphere = influence_sphere
+		self.band = band
+
+	# The real agent lives elsewhere, so we forward the sound to its band
+	def adopt_sound(self, sound, sound_origin_country):
+		self.model.outgoing_conversations.setdefault(self.band, []).append((self.unique_id, sound, sound_origin_country))
+
+# The part of the model which is simulated by one worker process
+class BandModel(BorderModel):
+	def __init__(self, model_params, band, band_edges, agent_states, seed):
+		self.band = band
+		self.band_edges = band_edges
+		self.incoming_states = agent_states
+
+		self.ghosts = []
+		self.outgoing_conversations = {}
+		self.central_pool = {}
+
+		super().__init__(**model_params)
+
+		self.random = random.Random(seed)
+		self.init_random_streams(seed)
+
+	def init_agents(self):
+		for state in self.incoming_states:
+			self.add_agent_state(state)
+
+		self.incoming_states = None
+
+	def add_agent_state(self, state):
+		agent = BorderAgent.from_state(state, self)
+		self.schedule.add(agent)
+		self.grid.place_agent(agent, tuple(state["pos"]))
+
+	# Data collection happens in the coordinator, and the band only steps when it is told to
+	def collect_data_bulk(self):
+		pass
+
+	def init_data_collect(self):
+		pass
+
+	def step(self):
+		pass
+
+	def get_central_sound(self, country):
+		return self.media_random.choice(self.central_pool[country])
+
+	# Ghosts are spoken to as well, their sounds are forwarded to their own band
+	def speech_listeners(self):
+		return self.schedule.agents, self.ghosts
+
+	def band_step(self, ghosts, migrants, central_pool):
+		# Replace last step's ghosts
+		for ghost in self.ghosts:
+			self.grid.remove_agent(ghost)
+
+		self.ghosts = []
+		for unique_id, sphere_name, pos, band in ghosts:
+			ghost = GhostAgent(unique_id, self, self.influence_spheres_by_name[sphere_name], band)
+			self.grid.place_agent(ghost, pos)
+			self.ghosts.append(ghost)
+
+		for state in migrants:
+			self.add_agent_state(state)
+
+		self.central_pool = central_pool
+		self.outgoing_conversations = {}
+
+		self.activate_agents()
+
+		return self.outgoing_conversations
+
+	def band_finish(self, conversations):
+		agents = self.schedule._agents
+		for unique_id, sound, sound_origin_country in conversations:
+			agents[unique_id].adopt_sound(sound, sound_origin_country)
+
+		self.reset_agents()
+
+		# Statistics are computed before emigration, so every agent is counted exactly once
+		statistics = self.band_statistics()
+		central_sample = self.central_sample()
+
+		# Hand over the agents which left the band
+		migrants = []
+		y0, y1 = self.band_edges[self.band], self.band_edges[self.band + 1]
+		for agent in self.schedule.agents:
+			if not y0 <= agent.pos[1] < y1:
+				migrants.append(agent.get_state())
+				if self.sound_histograms:
+					self.sound_histograms.remove_all(agent.influence_sphere.index, agent.sound_repository)
+				self.schedule.remove(agent)
+				self.grid.remove_agent(agent)
+
+		# Agents on the outer rows of the band are ghosts for the neighbouring bands
+		boundary = [ (agent.unique_id, agent.influence_sphere.name, agent.pos) for agent in self.schedule.agents \
+					 if agent.pos[1] in (y0, y1 - 1) ]
+
+		return statistics, central_sample, migrants, boundary
+
+	# Partial sums which the coordinator adds up into the model reporters
+	def band_statistics(self):
+		statistics = { "whereabouts": { "home": 0, "travelling": 0, "visiting": 0 },
+					   "agents": 0,
+					   "sound_repository_length": 0,
+					   "countries": { "The Netherlands": [ 0, 0 ], "Belgium": [ 0, 0 ] },
+					   "spheres": { influence_sphere.name: [ 0, 0 ] for influence_sphere in self.influence_spheres } }
+
+		for agent in self.schedule.agents:
+			statistics["whereabouts"][agent.whereabouts()] += 1
+			statistics["agents"] += 1
+			statistics["sound_repository_length"] += len(agent.sound_repository)
+
+			sound_sum = self.sound_storage.total(agent.sound_repository)
+			for totals in (statistics["countries"][agent.influence_sphere.country],
+						   statistics["spheres"][agent.influence_sphere.name]):
+				totals[0] += sound_sum
+				totals[1] += len(agent.sound_repository)
+
+		if self.sound_histograms:
+			statistics["histograms"] = self.sound_histograms.counts
+
+		# The coordinator collects its data for the step the bands just finished
+		if self.sound_rasters and self.schedule.steps % self.sound_rasters.interval == 0:
+			statistics["raster"] = (self.schedule.steps, *self.sound_rasters.partial(self.schedule.agents, self.sound_storage))
+
+		return statistics
+
+	# Sample sounds of random agents from central spheres, together with the number of central agents in this band
+	def central_sample(self):
+		central_agents = { THE_NETHERLANDS: [], BELGIUM: [] }
+		for agent in self.schedule.agents:
+			if agent.influence_sphere.central:
+				central_agents[agent.country].append(agent)
+
+		central_sample = {}
+		for country, agents in central_agents.items():
+			sample = []
+			if agents:
+				sample = [ self.sound_storage.decode(self.media_random.choice(self.media_random.choice(agents).sound_repository)) \
+						   for i in range(CENTRAL_POOL_SIZE) ]
+			central_sample[country] = (len(agents), sample)
+
+		return central_sample
+
+# Sent back to the coordinator when something goes wrong inside a band process
+class BandFailure():
+	def __init__(self, band, message):
+		self.band = band
+		self.message = message
+
+def run_band(connection, model_params, band, band_edges, agent_states, seed):
+	model = BandModel(model_params, band, band_edges, agent_states, seed)
+
+	while True:
+		command, payload = connection.recv()
+		try:
+			if command == "step":
+				connection.send(model.band_step(*payload))
+			elif command == "finish":
+				connection.send(model.band_finish(payload))
+			elif command == "stop":
+				break
+		except Exception:
+			connection.send(BandFailure(band, traceback.format_exc()))
+
+	connection.close()
+
+def receive(connection):
+	result = connection.recv()
+	if isinstance(result, BandFailure):
+		raise RuntimeError("Band {} failed:\n{}".format(result.band, result.message))
+
+	return result
+
+def stop_bands(connections, processes):
+	for connection in connections:
+		try:
+			connection.send(("stop", None))
+		except (BrokenPipeError, OSError):
+			pass
+
+	for process in processes:
+		process.join()
+
+# The coordinator: looks like a regular BorderModel from the outside, but the agents live in the band processes
+class BandedBorderModel(BorderModel):
+	def __init__(self, width, height, bands=2, **kwargs):
+		self.bands = bands
+		self.model_params = { "width": width, "height": height, **kwargs }
+
+		self.connections = None
+		self.processes = None
+
+		super().__init__(width, height, **kwargs)
+
+	# Cut the grid into bands holding roughly the same number of agents (the spheres are not spread evenly)
+	def compute_band_edges(self):
+		rows = sorted(agent.pos[1] for agent in self.schedule.agents)
+
+		band_edges = [ 0 ]
+		for band in range(1, self.bands):
+			edge = rows[len(rows) * band // self.bands]
+			# Bands must be at least two rows high, so the halo of a band never reaches past its neighbours
+			edge = max(edge, band_edges[-1] + 2)
+			edge = min(edge, self.height - 2 * (self.bands - band))
+			band_edges.append(edge)
+		band_edges.append(self.height)
+
+		return band_edges
+
+	def band_of(self, y):
+		return bisect.bisect_right(self.band_edges, y) - 1
+
+	def start_bands(self):
+		self.band_edges = self.compute_band_edges()
+
+		agent_states = [ [] for band in range(self.bands) ]
+		for agent in self.schedule.agents:
+			agent_states[self.band_of(agent.pos[1])].append(agent.get_state())
+
+		self.connections = []
+		self.processes = []
+		for band in range(self.bands):
+			parent_connection, child_connection = multiprocessing.Pipe()
+			process = multiprocessing.Process(target=run_band, daemon=True,
+											  args=(child_connection, self.model_params, band, self.band_edges,
+													agent_states[band], self.random.getrandbits(64)))
+			process.start()
+			child_connection.close()
+
+			self.connections.append(parent_connection)
+			self.processes.append(process)
+
+		self.finalizer = weakref.finalize(self, stop_bands, self.connections, self.processes)
+
+		# The first halo is built from the agents before they are handed over
+		boundaries = [ [] for band in range(self.bands) ]
+		for agent in self.schedule.agents:
+			band = self.band_of(agent.pos[1])
+			if agent.pos[1] in (self.band_edges[band], self.band_edges[band + 1] - 1):
+				boundaries[band].append((agent.unique_id, agent.influence_sphere.name, agent.pos))
+
+		self.route_agents([ [] for band in range(self.bands) ], boundaries)
+		self.central_pool = { country: [ self.get_central_sound(country) for i in range(CENTRAL_POOL_SIZE) ] \
+							  for country in (THE_NETHERLANDS, BELGIUM) }
+
+		# The agents now live in the bands
+		self.schedule = RandomActivation(self)
+		self.grid = MultiGrid(self.width, self.height, False)
+
+	def close(self):
+		if self.connections is not None:
+			self.finalizer()
+
+	def step(self):
+		if self.connections is None:
+			# Before the bands are started, the agents still live in this model
+			self.collect_data_bulk()
+			self.start_bands()
+
+		self.datacollector.collect(self)
+
+		# 1. Every band steps its own agents
+		for band, connection in enumerate(self.connections):
+			connection.send(("step", (self.ghosts[band], self.migrants[band], self.central_pool)))
+
+		conversations = [ [] for band in range(self.bands) ]
+		for connection in self.connections:
+			for band, band_conversations in receive(connection).items():
+				conversations[band] += band_conversations
+
+		# 2. Every band adopts the conversations addressed to it and reports back
+		for band, connection in enumerate(self.connections):
+			connection.send(("finish", conversations[band]))
+
+		reports = [ receive(connection) for connection in self.connections ]
+
+		self.route_agents([ report[2] for report in reports ], [ report[3] for report in reports ])
+		self.combine_statistics([ report[0] for report in reports ])
+		self.combine_central_samples([ report[1] for report in reports ])
+
+		self.schedule.steps += 1
+		self.schedule.time += 1
+
+	def route_agents(self, migrants, boundaries):
+		self.migrants = [ [] for band in range(self.bands) ]
+		self.ghosts = [ [] for band in range(self.bands) ]
+
+		# Ghost records: (unique_id, sphere name, position, owning band)
+		ghost_records = []
+		for band, boundary in enumerate(boundaries):
+			ghost_records += [ (unique_id, sphere_name, pos, band) for unique_id, sphere_name, pos in boundary ]
+
+		for band_migrants in migrants:
+			for state in band_migrants:
+				band = self.band_of(state["pos"][1])
+				self.migrants[band].append(state)
+				ghost_records.append((state["unique_id"], state["influence_sphere"], state["pos"], band))
+
+		# Every band gets the agents living in the rows just above and below it
+		for record in ghost_records:
+			y = record[2][1]
+
+			neighbouring_bands = set()
+			if y > 0:
+				neighbouring_bands.add(self.band_of(y - 1))
+			if y < self.height - 1:
+				neighbouring_bands.add(self.band_of(y + 1))
+			neighbouring_bands.discard(record[3])
+
+			for band in neighbouring_bands:
+				self.ghosts[band].append(record)
+
+	def combine_statistics(self, band_statistics):
+		self.whereabouts_data = { "home": 0, "travelling": 0, "visiting": 0 }
+		agents = 0
+		sound_repository_length = 0
+		countries = { "The Netherlands": [ [], 0 ], "Belgium": [ [], 0 ] }
+		spheres = { influence_sphere.name: [ [], 0 ] for influence_sphere in self.influence_spheres }
+
+		for statistics in band_statistics:
+			for whereabouts in self.whereabouts_data:
+				self.whereabouts_data[whereabouts] += statistics["whereabouts"][whereabouts]
+			agents += statistics["agents"]
+			sound_repository_length += statistics["sound_repository_length"]
+
+			for totals, band_totals in [ (countries[country], statistics["countries"][country]) for country in countries ] + \
+									   [ (spheres[name], statistics["spheres"][name]) for name in spheres ]:
+				totals[0].append(band_totals[0])
+				totals[1] += band_totals[1]
+
+		self.average_population_sound_repository_length = round(fractions.Fraction(sound_repository_length, agents))
+		self.average_sounds = { country: round(math.fsum(totals[0]) / totals[1], 9) for country, totals in countries.items() }
+		self.average_sounds_spheres = { name: round(math.fsum(totals[0]) / totals[1], 9) for name, totals in spheres.items() }
+
+		# The histograms of the bands add up to the histograms of the whole grid
+		if self.sound_histograms:
+			self.sound_histograms.counts = [ [ sum(column) for column in zip(*band_counts) ] \
+											 for band_counts in zip(*[ statistics["histograms"] for statistics in band_statistics ]) ]
+			self.collect_distributions()
+
+		if self.sound_rasters and "raster" in band_statistics[0]:
+			self.sound_rasters.add(band_statistics[0]["raster"][0],
+								   sum(statistics["raster"][1] for statistics in band_statistics),
+								   sum(statistics["raster"][2] for statistics in band_statistics))
+
+	# Merge the central sound samples of all bands, weighted by the number of central agents in each band
+	def combine_central_samples(self, central_samples):
+		for country in self.central_pool:
+			weights = [ central_sample[country][0] for central_sample in central_samples ]
+			if sum(weights) == 0:
+				self.central_pool[country] = []
+				continue
+
+			bands = self.random.choices(range(self.bands), weights=weights, k=CENTRAL_POOL_SIZE)
+			self.central_pool[country] = [ self.random.choice(central_samples[band][country][1]) for band in bands ]
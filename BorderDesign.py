@@ -0,0 +1,156 @@
+import itertools
+import json
+import math
+import os
+import random
+
+import numpy
+
+# Sweep files
+# -----------
+# A sweep file describes the parameter sets of a sweep declaratively, instead of a theory/stage branch in BorderThink:
+#
+# {
+#     "name": "travel_ethnocentrism",            report name (default: the file name)
+#     "design": "lhs",                           grid, lhs (Latin hypercube) or sobol
+#     "runs": 64,                                number of parameter sets (lhs and sobol)
+#     "seed": 1,                                 seed of the Latin hypercube
+#     "fixed_params": { "media_receptiveness": false },
+#     "parameters": {
+#         "ethnocentrism_be": { "min": 0, "max": 1 },
+#         "abroad_travel_chance_nl": { "min": 0.0001, "max": 0.01, "scale": "log" },
+#         "abroad_travel_chance_be": { "same_as": "abroad_travel_chance_nl" },
+#         "target_accel_count": { "min": 1, "max": 20, "type": "int" },
+#         "scaled_ethnocentrism": { "values": [ false, true ] }
+#     }
+# }
+#
+# In a grid design, every parameter needs "values" or "min", "max" and "step", and all combinations are run.
+# In the other designs, every parameter set is a point of the design in the unit cube, scaled to the parameter ranges.
+
+DESIGNS = [ "grid", "lhs", "sobol" ]
+
+# Sobol direction numbers (Joe & Kuo, new-joe-kuo-6.21201) for dimensions 2 and up: (degree, polynomial, m values)
+SOBOL_DIRECTIONS = [ (1, 0, [ 1 ]),
+					 (2, 1, [ 1, 3 ]),
+					 (3, 1, [ 1, 3, 1 ]),
+					 (3, 2, [ 1, 1, 1 ]),
+					 (4, 1, [ 1, 1, 3, 3 ]),
+					 (4, 4, [ 1, 3, 5, 13 ]),
+					 (5, 2, [ 1, 1, 5, 5, 17 ]),
+					 (5, 4, [ 1, 1, 5, 5, 5 ]),
+					 (5, 7, [ 1, 1, 7, 11, 19 ]),
+					 (5, 11, [ 1, 1, 5, 1, 1 ]),
+					 (5, 13, [ 1, 1, 1, 3, 11 ]),
+					 (5, 14, [ 1, 3, 5, 5, 31 ]) ]
+
+SOBOL_BITS = 32
+
+def sobol_direction_vectors(dimension):
+	if dimension == 0:
+		return [ 1 << (SOBOL_BITS - 1 - i) for i in range(SOBOL_BITS) ]
+
+	degree, polynomial, m = SOBOL_DIRECTIONS[dimension - 1]
+	m = list(m)
+	for i in range(degree, SOBOL_BITS):
+		value = m[i - degree] ^ (m[i - degree] << degree)
+		for k in range(1, degree):
+			if (polynomial >> (degree - 1 - k)) & 1:
+				value ^= m[i - k] << k
+		m.append(value)
+
+	return [ m[i] << (SOBOL_BITS - 1 - i) for i in range(SOBOL_BITS) ]
+
+# The first count points of the Sobol sequence in dimensions dimensions (Gray code order, first point is the origin)
+def sobol_points(count, dimensions):
+	if dimensions > len(SOBOL_DIRECTIONS) + 1:
+		raise ValueError("Sobol designs support up to {} parameters".format(len(SOBOL_DIRECTIONS) + 1))
+
+	directions = [ sobol_direction_vectors(dimension) for dimension in range(dimensions) ]
+	state = [ 0 ] * dimensions
+
+	points = numpy.zeros((count, dimensions))
+	for index in range(1, count):
+		# Position of the lowest zero bit of index - 1
+		bit = ((index - 1) ^ index).bit_length() - 1
+		for dimension in range(dimensions):
+			state[dimension] ^= directions[dimension][bit]
+			points[index, dimension] = state[dimension] / 2 ** SOBOL_BITS
+
+	return points
+
+# Every parameter range is cut into count equal strata, every stratum is hit exactly once
+def latin_hypercube_points(count, dimensions, rng):
+	points = numpy.zeros((count, dimensions))
+	for dimension in range(dimensions):
+		strata = list(range(count))
+		rng.shuffle(strata)
+		points[:, dimension] = [ (stratum + rng.random()) / count for stratum in strata ]
+
+	return points
+
+# Map a coordinate in [0, 1) onto the range of a parameter
+def scale_value(specification, unit):
+	if "values" in specification:
+		values = specification["values"]
+		return values[min(int(unit * len(values)), len(values) - 1)]
+
+	low, high = specification["min"], specification["max"]
+
+	if specification.get("type") == "int":
+		return min(int(low + unit * (high - low + 1)), high)
+
+	if specification.get("scale") == "log":
+		return math.exp(math.log(low) + unit * (math.log(high) - math.log(low)))
+
+	return low + unit * (high - low)
+
+def grid_values(specification):
+	if "values" in specification:
+		return specification["values"]
+
+	# Half a step of slack, so the maximum is included like in the numpy.arange calls of BorderThink
+	return [ float(value) for value in numpy.arange(specification["min"], specification["max"] + specification["step"] / 2,
+													 specification["step"]) ]
+
+class SweepDefinition():
+	def __init__(self, filename):
+		with open(filename) as sweep_file:
+			sweep = json.load(sweep_file)
+
+		self.filename = filename
+		self.name = sweep.get("name", os.path.splitext(os.path.basename(filename))[0])
+		self.design = sweep.get("design", "grid")
+		self.runs = sweep.get("runs")
+		self.seed = sweep.get("seed")
+		self.fixed_params = sweep.get("fixed_params", {})
+		self.parameters = sweep["parameters"]
+
+		if self.design not in DESIGNS:
+			raise ValueError("Unknown design '{}' in {}, choose from: {}".format(self.design, filename, ", ".join(DESIGNS)))
+		if self.design != "grid" and not self.runs:
+			raise ValueError("A {} design needs a number of runs".format(self.design))
+
+		# Parameters which copy the value of another parameter
+		self.linked = { name: specification["same_as"] for name, specification in self.parameters.items() \
+						if "same_as" in specification }
+		self.varied = [ name for name in self.parameters if name not in self.linked ]
+
+	def parameters_list(self):
+		if self.design == "grid":
+			combinations = itertools.product(*[ grid_values(self.parameters[name]) for name in self.varied ])
+			parameters_list = [ dict(zip(self.varied, combination)) for combination in combinations ]
+		else:
+			if self.design == "lhs":
+				points = latin_hypercube_points(self.runs, len(self.varied), random.Random(self.seed))
+			else:
+				points = sobol_points(self.runs, len(self.varied))
+
+			parameters_list = [ { name: scale_value(self.parameters[name], unit) for name, unit in zip(self.varied, point) } \
+								for point in points ]
+
+		for parameters in parameters_list:
+			for name, source in self.linked.items():
+				parameters[name] = parameters[source]
+
+		return parameters_list
@@ -0,0 +1,205 @@
+import argparse
+import math
+import sys
+
+import numpy
+import pandas
+
+from BorderBands import BandedBorderModel
+from BorderModel import BorderModel
+from BorderSweep import make_jobs, run_sweep
+
+# Statistical equivalence of an alternative engine
+# ------------------------------------------------
+# Batched, event-driven or banded engines do not reproduce the reference model step for step, so instead of comparing
+# runs, this compares distributions. For every configuration, the reference model and the alternative engine are run
+# over independent seeds. At a number of checkpoint steps, the values of every reporter (mean sounds, whereabouts
+# counts, sphere means) are compared with a two-sample Kolmogorov-Smirnov test, its p-value from a permutation test.
+# The p-values of a configuration are corrected for multiple testing (Holm). An engine passes if no difference is
+# significant in any configuration.
+#
+# Passing means no difference was found with this many seeds, so more seeds make a stronger check. The standardized
+# mean difference (in pooled standard deviations of both samples) shows how large the differences are; it is NaN
+# where both samples are constant.
+
+# Model parameters of every engine, on top of the configuration
+ENGINES = { "event-driven-travel": { "event_driven_travel": True },
+			"batched-movement": { "batched_movement": True },
+			"batched-speech": { "batched_speech": True },
+			"staged": { "activation": "staged" },
+			"batches": { "activation": "batches" },
+			"separate-streams": { "separate_streams": True },
+			"float32": { "sound_storage": "float32" },
+			"uint16": { "sound_storage": "uint16" },
+			"bands": { "bands": 2 } }
+
+# Canonical configurations, after the BorderThink theories
+CONFIGURATIONS = { "contact": { "abroad_travel_chance_nl": 0.001, "abroad_travel_chance_be": 0.001,
+								"ethnocentrism_nl": 0, "ethnocentrism_be": 0, "media_receptiveness": False },
+				   "isolation": { "abroad_travel_chance_nl": 1 / pow(10, 6), "abroad_travel_chance_be": 1 / pow(10, 6),
+								  "ethnocentrism_nl": 0, "ethnocentrism_be": 0, "media_receptiveness": False },
+				   "ethnocentrism": { "abroad_travel_chance_nl": 0.001, "abroad_travel_chance_be": 0.001,
+									  "ethnocentrism_nl": 0.85, "ethnocentrism_be": 0.95, "media_receptiveness": False },
+				   "media": { "abroad_travel_chance_nl": 0.001, "abroad_travel_chance_be": 0.001,
+							  "ethnocentrism_nl": 0, "ethnocentrism_be": 0, "media_receptiveness": 0.5 } }
+
+# Reporters which say nothing about the dynamics
+EXCLUDED_REPORTERS = [ "sound_repo_size" ]
+
+# Largest difference between the empirical distribution functions of the samples in every row of labels
+# (True: first sample), for the pooled values in sorted order
+def ks_statistics(sorted_values, labels):
+	first_count = labels.sum(axis=1)[:, None]
+	second_count = labels.shape[1] - first_count
+
+	differences = numpy.abs(numpy.cumsum(labels, axis=1) / first_count - numpy.cumsum(~labels, axis=1) / second_count)
+
+	# Tied values count together: only compare after the last of every run of equal values
+	group_ends = numpy.append(sorted_values[1:] != sorted_values[:-1], True)
+	return differences[:, group_ends].max(axis=1)
+
+# Two-sample Kolmogorov-Smirnov statistic and its permutation p-value
+def ks_permutation_test(first, second, permutations, rng):
+	values = numpy.concatenate([ first, second ])
+	order = numpy.argsort(values, kind="stable")
+	sorted_values = values[order]
+
+	observed_labels = (order < len(first))[None, :]
+	observed = ks_statistics(sorted_values, observed_labels)[0]
+
+	# Every permutation hands the first sample's labels to a random subset of the pooled values
+	shuffled = numpy.argsort(rng.random((permutations, len(values))), axis=1) < len(first)
+	permuted = ks_statistics(sorted_values, shuffled)
+
+	return observed, (1 + numpy.count_nonzero(permuted >= observed - 1e-12)) / (1 + permutations)
+
+# Holm-Bonferroni adjusted p-values
+def holm_adjust(p_values):
+	p_values = numpy.asarray(p_values)
+	order = numpy.argsort(p_values)
+	adjusted = numpy.empty(len(p_values))
+	adjusted[order] = numpy.minimum(1, numpy.maximum.accumulate(p_values[order] * (len(p_values) - numpy.arange(len(p_values)))))
+
+	return adjusted
+
+def run_frames(model_class, fixed_params, seeds, processes):
+	jobs = make_jobs([ {} ], fixed_params, len(seeds), seeds)
+	return [ run_frame for job, run_frame in run_sweep(model_class, jobs, args.steps, processes=processes) ]
+
+# Standard deviation of two samples together, each around its own mean
+def pooled_deviation(first, second):
+	return math.sqrt(((len(first) - 1) * first.var(ddof=1) + (len(second) - 1) * second.var(ddof=1)) / (len(first) + len(second) - 2))
+
+def compare(reference_frames, alternative_frames, checkpoints, permutations, alpha, rng):
+	reporters = [ column for column in reference_frames[0].columns if column not in EXCLUDED_REPORTERS ]
+
+	# The smallest p-value a permutation test can give is 1 / (permutations + 1), which must survive the Holm
+	# correction over all tests
+	permutations = max(permutations, math.ceil(2 * len(checkpoints) * len(reporters) / alpha))
+
+	rows = []
+	for step in checkpoints:
+		for reporter in reporters:
+			reference = numpy.array([ frame[reporter].iloc[step] for frame in reference_frames ], dtype=numpy.float64)
+			alternative = numpy.array([ frame[reporter].iloc[step] for frame in alternative_frames ], dtype=numpy.float64)
+
+			statistic, p_value = ks_permutation_test(reference, alternative, permutations, rng)
+			deviation = pooled_deviation(reference, alternative)
+			difference = alternative.mean() - reference.mean()
+
+			rows.append({ "step": step,
+						  "reporter": reporter,
+						  "reference_mean": reference.mean(),
+						  "alternative_mean": alternative.mean(),
+						  "standardized_difference": difference / deviation if deviation > 0 else numpy.nan,
+						  "ks": statistic,
+						  "p": p_value })
+
+	return rows
+
+parser = argparse.ArgumentParser(description='BorderEquivalence - check that an alternative engine produces the same distributions as the reference model')
+parser.add_argument('engine', type=str, choices=list(ENGINES), help='engine to compare with the reference model')
+parser.add_argument('--configurations', type=str, nargs='+', choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS), help='configurations to compare (default: all)')
+parser.add_argument('--seeds', type=int, default=20, help='number of seeds (runs per engine and configuration)')
+parser.add_argument('--steps', type=int, default=200, help='number of steps per run')
+parser.add_argument('--checkpoints', type=int, default=4, help='number of steps at which the distributions are compared, spread evenly up to the last step')
+parser.add_argument('--permutations', type=int, default=2000, help='permutations per test, at least enough for a difference to survive the multiple testing correction (default: 2000)')
+parser.add_argument('--alpha', type=float, default=0.05, help='significance level per configuration, after the Holm correction')
+parser.add_argument('--processes', type=int, default=1, help='how many runs to simulate in parallel')
+parser.add_argument('--output', type=str, default=None, help='write every test to this CSV file')
+parser.add_argument('--spheres', type=str, default="spheres.json", help='sphere file')
+parser.add_argument('--width', type=int, default=100, help='grid width')
+parser.add_argument('--height', type=int, default=240, help='grid height')
+parser.add_argument('--border-heights', type=int, nargs=2, default=[ 124, 104 ], help='border heights (left, right)')
+args = parser.parse_args()
+
+# Same fixed parameters as BorderThink
+base_params = { "width": args.width,
+				"height": args.height,
+				"return_chance": 0.05,
+				"home_chance": 0.005,
+				"domestic_travel_chance_nl": 0.005,
+				"domestic_travel_chance_be": 0.005,
+				"scaled_ethnocentrism": False,
+				"decay_limit": 140,
+				"sound_mean_interval": 0.1,
+				"border_heights": args.border_heights,
+				"init_big_inventory": True,
+				"spheres_file": args.spheres }
+
+engine_params = ENGINES[args.engine]
+engine_class = BandedBorderModel if "bands" in engine_params else BorderModel
+
+# Band processes cannot be started from sweep workers
+engine_processes = 1 if engine_class is BandedBorderModel else args.processes
+
+checkpoints = sorted({ round((args.steps - 1) * (i + 1) / args.checkpoints) for i in range(args.checkpoints) })
+rng = numpy.random.default_rng(0)
+
+# The engine runs on other seeds than the reference, the samples are independent
+reference_seeds = list(range(args.seeds))
+engine_seeds = list(range(args.seeds, 2 * args.seeds))
+
+all_rows = []
+failed_configurations = []
+
+for configuration in args.configurations:
+	fixed_params = { **base_params, **CONFIGURATIONS[configuration] }
+
+	print("{}: running the reference model and {} over {} seeds each".format(configuration, args.engine, args.seeds))
+	reference_frames = run_frames(BorderModel, fixed_params, reference_seeds, args.processes)
+	engine_frames = run_frames(engine_class, { **fixed_params, **engine_params }, engine_seeds, engine_processes)
+
+	rows = compare(reference_frames, engine_frames, checkpoints, args.permutations, args.alpha, rng)
+	for row, adjusted in zip(rows, holm_adjust([ row["p"] for row in rows ])):
+		row["configuration"] = configuration
+		row["p_holm"] = adjusted
+		row["different"] = adjusted < args.alpha
+
+	differences = [ row for row in rows if row["different"] ]
+	summary = "{}: {} tests, {} significant differences".format(configuration, len(rows), len(differences))
+
+	# Constant reporters have no standardized difference
+	standardized_rows = [ row for row in rows if not numpy.isnan(row["standardized_difference"]) ]
+	if standardized_rows:
+		largest = max(standardized_rows, key=lambda row: abs(row["standardized_difference"]))
+		summary += ", largest standardized difference {:.2f} ({} at step {})".format(largest["standardized_difference"],
+																					   largest["reporter"], largest["step"])
+	print(summary)
+
+	for row in differences:
+		print("  {} at step {}: reference {:.6g}, {} {:.6g}, KS {:.2f}, p (Holm) {:.3g}".format(
+			row["reporter"], row["step"], row["reference_mean"], args.engine, row["alternative_mean"], row["ks"], row["p_holm"]))
+
+	if differences:
+		failed_configurations.append(configuration)
+	all_rows += rows
+
+if args.output:
+	pandas.DataFrame(all_rows).to_csv(args.output, sep=";", index=False)
+
+if failed_configurations:
+	print("FAIL: {} differs from the reference model in {}".format(args.engine, ", ".join(failed_configurations)))
+	sys.exit(1)
+
+print("PASS: no significant differences between {} and the reference model".format(args.engine))
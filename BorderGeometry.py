@@ -0,0 +1,99 @@
+import json
+import math
+
+import numpy
+
+# Scenario geometry
+# -----------------
+# The spheres and the border of a scenario, without any agents. Analysis scripts can use this to answer distance,
+# membership and border questions in milliseconds, instead of starting up a full BorderModel (which creates every
+# agent and computes all travel probabilities). BorderModel uses the same functions.
+
+# https://stackoverflow.com/questions/39840030/distance-between-point-and-a-line-from-two-points
+# (the 2-D cross product is written out, numpy.cross is deprecated for 2-D vectors since numpy 2.0)
+def distance_to_line(line_begin, line_end, point):
+	(x0, y0), (x1, y1), (px, py) = line_begin, line_end, point
+	dx = x1 - x0
+	dy = y1 - y0
+
+	return abs(dx * (y0 - py) - dy * (x0 - px)) / math.hypot(dx, dy)
+
+def distance_between_points(x0, x1, y0, y1):
+	return math.hypot(x0 - x1,
+					  y0 - y1)
+
+# The border runs from the left edge to the right edge of the grid (only the y axis is controllable)
+def border_coords(width, border_heights):
+	return [ (0, border_heights[0]), (width, border_heights[1]) ]
+
+# Which side of the border is which country? (y grows downwards, so The Netherlands lies above the border)
+def border_side(border_coords, x, y):
+	(x0, y0), (x1, y1) = border_coords
+	border_y = y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+	return "The Netherlands" if y < border_y else "Belgium"
+
+# The longest distance from the border to the top (The Netherlands) or bottom (Belgium) of the grid
+def border_longest_distance(width, height, border_coords):
+	distances = { "The Netherlands": [],
+				  "Belgium": [] }
+
+	for x in range(0, width + 1, 1):
+		distances["The Netherlands"].append(distance_to_line(border_coords[0], border_coords[1], (x, 0)))
+		distances["Belgium"].append(distance_to_line(border_coords[0], border_coords[1], (x, height)))
+
+	return { country: round(max(country_distances)) for country, country_distances in distances.items() }
+
+class SphereGeometry():
+	__slots__ = [ "name", "country", "x", "y", "radius", "population", "sound_mean", "central" ]
+
+	def __init__(self, x, y, radius, population=None, sound_mean=None, name=None, country=None, central=None):
+		self.name = name
+		self.country = country
+		self.x = x
+		self.y = y
+		self.radius = radius
+		self.population = population
+		self.sound_mean = sound_mean
+		self.central = central
+
+	def distance(self, x, y):
+		return distance_between_points(self.x, x, self.y, y)
+
+	# Same rule as InfluenceSphere in BorderModel.py: the rounded up distance to the center is at most the radius
+	def contains(self, x, y):
+		return math.ceil(self.distance(x, y)) <= self.radius
+
+class ScenarioGeometry():
+	def __init__(self, spheres_file="spheres.json", width=100, height=240, border_heights=[ 74, 54 ]):
+		self.width = width
+		self.height = height
+		self.border_coords = border_coords(width, border_heights)
+
+		with open(spheres_file) as spheres_json:
+			self.spheres = [ SphereGeometry(**sphere) for sphere in json.load(spheres_json) ]
+
+		self.spheres_by_name = { sphere.name: sphere for sphere in self.spheres }
+
+	def sphere(self, name):
+		return self.spheres_by_name[name]
+
+	def spheres_of(self, country):
+		return [ sphere for sphere in self.spheres if sphere.country == country ]
+
+	# Spheres which contain a cell
+	def spheres_at(self, x, y):
+		return [ sphere for sphere in self.spheres if sphere.contains(x, y) ]
+
+	def distance_between(self, name_a, name_b):
+		sphere_a, sphere_b = self.sphere(name_a), self.sphere(name_b)
+		return distance_between_points(sphere_a.x, sphere_b.x, sphere_a.y, sphere_b.y)
+
+	def distance_to_border(self, x, y):
+		return float(distance_to_line(self.border_coords[0], self.border_coords[1], (x, y)))
+
+	def country_at(self, x, y):
+		return border_side(self.border_coords, x, y)
+
+	def border_longest_distance(self):
+		return border_longest_distance(self.width, self.height, self.border_coords)
@@ -0,0 +1,93 @@
+import math
+
+# Sound histograms
+# ----------------
+# Every influence sphere keeps a histogram of the sounds in the repositories of its agents (fixed bins over [0, 1]).
+# The histograms are updated whenever a sound is stored or forgotten, so the distribution reporters (quantiles,
+# variance, bimodality) never need another pass over all repositories. Country histograms are the sum of the
+# histograms of their spheres.
+#
+# Sounds are binned by their stored value (see BorderStorage.py), so a sound always leaves the bin it entered.
+
+class SoundHistograms():
+	def __init__(self, bins, influence_spheres, sound_storage):
+		self.bins = bins
+		self.counts = [ [ 0 ] * bins for influence_sphere in influence_spheres ] # indexed by InfluenceSphere.index
+
+		# Stored values are sound * scale, so this takes a stored value straight to its bin
+		self.factor = bins / sound_storage.scale
+
+	def bin_of(self, value):
+		return min(int(value * self.factor), self.bins - 1)
+
+	def add(self, sphere_index, value, count=1):
+		self.counts[sphere_index][self.bin_of(value)] += count
+
+	def add_all(self, sphere_index, values):
+		counts = self.counts[sphere_index]
+		for value in values:
+			counts[self.bin_of(value)] += 1
+
+	def remove_all(self, sphere_index, values):
+		counts = self.counts[sphere_index]
+		for value in values:
+			counts[self.bin_of(value)] -= 1
+
+	# Sum of the histograms of a number of spheres
+	def merged(self, sphere_indices):
+		return [ sum(column) for column in zip(*[ self.counts[sphere_index] for sphere_index in sphere_indices ]) ]
+
+# Quantile q of a histogram, interpolating linearly inside the bin
+def histogram_quantile(counts, q):
+	total = sum(counts)
+	if total == 0:
+		return math.nan
+
+	target = q * total
+	cumulative = 0
+	for bin_index, count in enumerate(counts):
+		if count and cumulative + count >= target:
+			return (bin_index + (target - cumulative) / count) / len(counts)
+		cumulative += count
+
+	return 1
+
+# Mean, variance, skewness and kurtosis of a histogram (every sound counts as the center of its bin)
+def histogram_moments(counts):
+	total = sum(counts)
+	if total == 0:
+		return math.nan, math.nan, math.nan, math.nan
+
+	centers = [ (bin_index + 0.5) / len(counts) for bin_index in range(len(counts)) ]
+	mean = math.fsum(count * center for count, center in zip(counts, centers)) / total
+
+	central_moments = [ math.fsum(count * (center - mean) ** power for count, center in zip(counts, centers)) / total \
+						for power in (2, 3, 4) ]
+	variance = central_moments[0]
+	if variance == 0:
+		return mean, 0, math.nan, math.nan
+
+	skewness = central_moments[1] / variance ** 1.5
+	kurtosis = central_moments[2] / variance ** 2
+
+	return mean, variance, skewness, kurtosis
+
+# Sarle's bimodality coefficient: above 5/9 (the value for a uniform distribution) hints at a bimodal distribution
+def bimodality_coefficient(counts):
+	n = sum(counts)
+	mean, variance, skewness, kurtosis = histogram_moments(counts)
+	if n < 4 or math.isnan(skewness):
+		return math.nan
+
+	excess_kurtosis = kurtosis - 3
+	return (skewness ** 2 + 1) / (excess_kurtosis + 3 * (n - 1) ** 2 / ((n - 2) * (n - 3)))
+
+# Reporter values of one histogram
+def distribution_statistics(counts):
+	mean, variance, skewness, kurtosis = histogram_moments(counts)
+
+	return { "q10": round(histogram_quantile(counts, 0.1), 9),
+			 "median": round(histogram_quantile(counts, 0.5), 9),
+			 "q90": round(histogram_quantile(counts, 0.9), 9),
+			 "variance": round(variance, 9),
+			 "bimodality": round(bimodality_coefficient(counts), 9) }
@@ -0,0 +1,129 @@
+import inspect
+import os
+import tracemalloc
+
+# Memory use
+# ----------
+# Memory profile: with tracemalloc running, every live allocation is attributed to the code which made it, and that
+# code to a subsystem of the model:
+#
+#   sound repositories   the sounds agents heard (initial inventory, speech, media, decay)
+#   paths                travel paths and route tables
+#   collector            data collector records, histograms and rasters
+#   grid                 the mesa grid and the neighbourhood tables
+#   agents               the agents themselves and the scheduler
+#   other                everything else
+#
+# tracemalloc slows a run down a lot, so profiling is opt-in. The memory budget of a run only reads the resident
+# memory of its process (for banded models, the coordinator process) and stops the run when it has grown by more than
+# the budget since just before the model was built. The imports, and whatever a sweep worker still holds from its
+# earlier runs, do not count. Memory which an earlier run freed but the process kept is reused without showing up as
+# growth, so a run can use somewhat more than its budget in a long-lived worker.
+
+SUBSYSTEMS = [ "sound repositories", "paths", "collector", "grid", "agents", "other" ]
+
+class MemoryBudgetExceeded(MemoryError):
+	pass
+
+# Resident memory of this process in megabytes (None where /proc is not available)
+def current_rss_megabytes():
+	try:
+		with open("/proc/self/statm") as statm:
+			resident_pages = int(statm.read().split()[1])
+	except OSError:
+		return None
+
+	return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+# baseline_megabytes: the resident memory before the run started (see current_rss_megabytes)
+def check_memory_budget(budget_megabytes, baseline_megabytes):
+	rss = current_rss_megabytes()
+	if rss is not None and baseline_megabytes is not None and rss - baseline_megabytes > budget_megabytes:
+		raise MemoryBudgetExceeded("{:.1f} MB more in use than at the start of the run, the budget is {} MB".format(
+								   rss - baseline_megabytes, budget_megabytes))
+
+# (file, first line, last line, subsystem) for the code of every subsystem, functions before whole modules
+def subsystem_rules():
+	import mesa.agent
+	import mesa.datacollection
+	import mesa.space
+	import mesa.time
+
+	import BorderHistogram
+	import BorderRaster
+	import BorderRoutes
+	import BorderShared
+	import BorderSpeech
+	import BorderStorage
+	from BorderModel import BorderAgent, BorderModel, tronPath
+
+	def function_rule(function, subsystem):
+		lines, first_line = inspect.getsourcelines(function)
+		return (os.path.abspath(inspect.getsourcefile(function)), first_line, first_line + len(lines) - 1, subsystem)
+
+	def module_rule(module, subsystem):
+		return (os.path.abspath(module.__file__), 0, float("inf"), subsystem)
+
+	return [ function_rule(BorderAgent.init_sound, "sound repositories"),
+			 function_rule(BorderAgent.speak, "sound repositories"),
+			 function_rule(BorderAgent.adopt_sound, "sound repositories"),
+			 function_rule(BorderAgent.media_influence, "sound repositories"),
+			 function_rule(BorderModel.reset_agents, "sound repositories"),
+			 function_rule(tronPath, "paths"),
+			 function_rule(BorderAgent.set_travel_path, "paths"),
+			 function_rule(BorderAgent.travel, "paths"),
+			 function_rule(BorderAgent.home, "paths"),
+			 function_rule(BorderAgent.choose_step, "paths"),
+			 function_rule(BorderModel.init_data_collect, "collector"),
+			 function_rule(BorderModel.collect_data_bulk, "collector"),
+			 function_rule(BorderModel.collect_distributions, "collector"),
+			 function_rule(BorderModel.get_neighbourhood_table, "grid"),
+			 function_rule(BorderModel.get_neighbourhood, "grid"),
+			 function_rule(BorderAgent.__init__, "agents"),
+			 function_rule(BorderAgent.from_state, "agents"),
+			 function_rule(BorderModel.init_agents, "agents"),
+			 module_rule(BorderStorage, "sound repositories"),
+			 module_rule(BorderSpeech, "sound repositories"),
+			 module_rule(BorderRoutes, "paths"),
+			 module_rule(mesa.datacollection, "collector"),
+			 module_rule(BorderHistogram, "collector"),
+			 module_rule(BorderRaster, "collector"),
+			 module_rule(mesa.space, "grid"),
+			 module_rule(BorderShared, "grid"),
+			 module_rule(mesa.agent, "agents"),
+			 module_rule(mesa.time, "agents") ]
+
+def start_memory_profile():
+	tracemalloc.start()
+
+def stop_memory_profile():
+	tracemalloc.stop()
+
+# Megabytes in use per subsystem right now, plus the total and the peak since the profile started
+def memory_profile(rules=None):
+	if rules is None:
+		rules = subsystem_rules()
+
+	rules_by_file = {}
+	for filename, first_line, last_line, subsystem in rules:
+		rules_by_file.setdefault(filename, []).append((first_line, last_line, subsystem))
+
+	sizes = { subsystem: 0 for subsystem in SUBSYSTEMS }
+	for statistic in tracemalloc.take_snapshot().statistics("lineno"):
+		frame = statistic.traceback[0]
+		subsystem = "other"
+		for first_line, last_line, rule_subsystem in rules_by_file.get(os.path.abspath(frame.filename), []):
+			if first_line <= frame.lineno <= last_line:
+				subsystem = rule_subsystem
+				break
+		sizes[subsystem] += statistic.size
+
+	current, peak = tracemalloc.get_traced_memory()
+	profile = { subsystem: size / (1024 * 1024) for subsystem, size in sizes.items() }
+	profile["total"] = current / (1024 * 1024)
+	profile["peak"] = peak / (1024 * 1024)
+
+	return profile
+
+def format_memory_profile(profile):
+	return ", ".join("{} {:.1f} MB".format(subsystem, profile[subsystem]) for subsystem in [ "total", "peak" ] + SUBSYSTEMS)
@@ -4,27 +4,44 @@ import statistics
 import json
 import numpy
 import pprint
+import random
 import sys
 
-from mesa import Agent, Model
+from mesa import Model
 from mesa.time import RandomActivation
 from mesa.space import MultiGrid
 from mesa.datacollection import DataCollector
+from BorderGeometry import border_coords, border_longest_distance, distance_between_points, distance_to_line
+from BorderHistogram import SoundHistograms, distribution_statistics
+from BorderRaster import SoundRasters
+from BorderRoutes import RouteTable, load_route_table
+from BorderShared import attach_model_data, build_neighbourhood_table
+from BorderStorage import SoundStorage
+
+# Countries are stored as small integer codes (index in COUNTRIES), the names are only used for display and reporting
+COUNTRIES = [ "The Netherlands", "Belgium" ]
+COUNTRY_SUFFIXES = { "The Netherlands": "nl", "Belgium": "be" } # used in reporter names
+THE_NETHERLANDS = 0
+BELGIUM = 1
+
+ACTIVATION_MODES = [ "random", "staged", "batches" ]
+
+# Model components which can draw from their own random number stream (see BorderModel.init_random_streams)
+RANDOM_STREAMS = [ "placement", "movement", "conversation", "travel", "media" ]
 
 def build_sound_mean_lambda_new(influence_sphere_name):
 	return lambda model: model.average_sounds_spheres[influence_sphere_name]
 
-# https://stackoverflow.com/questions/39840030/distance-between-point-and-a-line-from-two-points
-def distance_to_line(line_begin, line_end, point):
-	line_begin = numpy.asarray(line_begin)
-	line_end = numpy.asarray(line_end)
-	point = numpy.asarray(point)
+# Number of failed steps before the first success, for an event with the given chance per step
+def geometric_wait(rng, chance):
+	if chance >= 1:
+		return 0
 
-	return numpy.abs(numpy.cross(line_end - line_begin, line_begin - point)) / numpy.linalg.norm(line_end - line_begin)
+	return int(math.log(1 - rng.random()) / math.log(1 - chance))
 
-def distance_between_points(x0, x1, y0, y1):
-	return math.hypot(x0 - x1, 
-					  y0 - y1)
+# key is a country or sphere name, statistic one of the keys of BorderHistogram.distribution_statistics
+def build_distribution_lambda(key, statistic):
+	return lambda model: model.sound_distributions[key][statistic]
 
 # Tron path
 def tronPath(a, b, minimum_distance):
@@ -81,15 +98,72 @@ def tronPath(a, b, minimum_distance):
 
 	return path[:n];
 
-class BorderAgent(Agent):
+def radiation_probabilities(influence_spheres):
+	travel_probabilities = {}
+
+	# For each influence sphere, compute the probability of an agent going to another influence sphere
+	for influence_sphere_destination in influence_spheres:
+		influence_sources = { "The Netherlands": {},
+							  "Belgium": {} }
+		total_influence = { "The Netherlands": 0,
+							  "Belgium": 0 }
+
+		for influence_sphere_source in influence_spheres:
+			# If destination is self, continue
+			if influence_sphere_source == influence_sphere_destination:
+				continue
+
+			# Find out the distance between the points we are comparing, then round it
+			spheres_distance = distance_between_points(influence_sphere_source.x, influence_sphere_destination.x,
+													   influence_sphere_source.y, influence_sphere_destination.y)
+			spheres_distance = round(spheres_distance)
+
+			# Implementation of:
+			#       P~i~ * P~j~                P~i~
+			# ------------------------- * --------------
+			#          d~ij~²              P~i~ + P~j~
+			influence = ((influence_sphere_source.population * influence_sphere_destination.population) / \
+											(spheres_distance * spheres_distance)) * \
+			((influence_sphere_source.population) / (influence_sphere_source.population + influence_sphere_destination.population))
+
+			# Idea: SOURCE OF INFLUENCE -> DESTINATION OF INFLUENCE
+			# is the result of DESTINATION visiting SOURCE
+			# so: REVERSAL = travel probabilities
+
+			# Save the probability to the a temporary dict
+			influence_sources[influence_sphere_source.country][influence_sphere_source.name] = influence
+			total_influence[influence_sphere_source.country] += influence
+		
+		# Compute probabilities depending on total influence on this sphere
+		for influence_source_country in influence_sources:
+			for influence_source in influence_sources[influence_source_country]:
+				travel_probabilities[(influence_sphere_destination.name, influence_source)] = \
+					round(influence_sources[influence_source_country][influence_source] / total_influence[influence_source_country], 2)
+
+	#pp = pprint.PrettyPrinter(indent=4)
+	#pp.pprint(travel_probabilities)
+
+	return travel_probabilities
+
+# BorderAgent does not inherit from mesa's Agent: Agent has no __slots__, so every agent would still carry an
+# instance __dict__. The scheduler and the grid only need unique_id, pos and step().
+class BorderAgent():
+	__slots__ = [ "unique_id", "model", "pos", "influence_sphere", "country", "sound", "sound_repository",
+				  "adopt_modifier", "travel_urge", "ethnocentrism", "media_receptiveness", "has_spoken",
+				  "travel_sphere", "travel_arrived", "domestic_travel_chance", "abroad_travel_chance", "path",
+				  "travel_event", "travel_event_step" ]
+
 	def __init__(self, unique_id, influence_sphere, sound_mean, model, ethnocentrism=1, media_receptiveness=0.05,
 					   domestic_travel_chance=0.005, abroad_travel_chance=0.001):
-		super().__init__(unique_id, model)
-		self.influence_sphere = influence_sphere
+		self.unique_id = unique_id
 		self.model = model
+		self.pos = None
+
+		self.influence_sphere = influence_sphere
+		self.country = influence_sphere.country_code # compared on every conversation, so kept as an integer code
 
 		self.sound = 1
-		self.sound_repository = [] # Previously heard sounds
+		self.sound_repository = model.sound_storage.repository() # Previously heard sounds (see BorderStorage.py)
 		self.adopt_modifier = 1 # How quickly does this agent want to adapt?
 		self.travel_urge = 1 # How much does this agent want to travel?
 		self.ethnocentrism = ethnocentrism # How nationalistic is this agent?
@@ -103,9 +177,79 @@ class BorderAgent(Agent):
 		# Travel probabilities
 		self.domestic_travel_chance = domestic_travel_chance # chance of an agent travelling to another sphere each step
 		self.abroad_travel_chance = abroad_travel_chance # chance of an agent travelling abroad each step
+
+		# Next travel event and the step at which it happens (only used for event-driven travel)
+		self.travel_event = None
+		self.travel_event_step = None
 	
 		self.init_sound(sound_mean)
 
+	# Serialise the agent to a plain dict (so it can be sent to another process, see BorderBands.py)
+	def get_state(self):
+		return { "unique_id": self.unique_id,
+				 "pos": self.pos,
+				 "influence_sphere": self.influence_sphere.name,
+				 "sound_repository": list(self.sound_repository),
+				 "ethnocentrism": self.ethnocentrism,
+				 "media_receptiveness": self.media_receptiveness,
+				 "domestic_travel_chance": self.domestic_travel_chance,
+				 "abroad_travel_chance": self.abroad_travel_chance,
+				 "travel_sphere": self.travel_sphere.name if self.travel_sphere else None,
+				 "travel_arrived": self.travel_arrived,
+				 "path": list(getattr(self, "path", [])),
+				 "travel_event": self.travel_event,
+				 "travel_event_step": self.travel_event_step }
+
+	# Rebuild an agent from a state dict without drawing a new initial sound
+	@classmethod
+	def from_state(cls, state, model):
+		agent = cls.__new__(cls)
+		agent.unique_id = state["unique_id"]
+		agent.model = model
+		agent.pos = None
+
+		agent.influence_sphere = model.influence_spheres_by_name[state["influence_sphere"]]
+		agent.country = agent.influence_sphere.country_code
+		agent.sound = 1
+		agent.sound_repository = model.sound_storage.repository(state["sound_repository"])
+		if model.sound_histograms:
+			model.sound_histograms.add_all(agent.influence_sphere.index, agent.sound_repository)
+		agent.adopt_modifier = 1
+		agent.travel_urge = 1
+		agent.ethnocentrism = state["ethnocentrism"]
+		agent.media_receptiveness = state["media_receptiveness"]
+		agent.has_spoken = False
+
+		agent.travel_sphere = model.influence_spheres_by_name[state["travel_sphere"]] if state["travel_sphere"] else False
+		agent.travel_arrived = state["travel_arrived"]
+		agent.path = [ tuple(point) for point in state["path"] ]
+
+		agent.domestic_travel_chance = state["domestic_travel_chance"]
+		agent.abroad_travel_chance = state["abroad_travel_chance"]
+
+		agent.travel_event = state["travel_event"]
+		agent.travel_event_step = state["travel_event_step"]
+
+		return agent
+
+	@property
+	def random(self):
+		return self.model.random
+
+	# Where is this agent? Used for the home/travelling/visiting reporters
+	def whereabouts(self):
+		# If the agent is not travelling, or they are travelling homewards, count them
+		# as being "home"
+		if not self.travel_sphere or self.travel_sphere == self.influence_sphere:
+			return "home"
+		# If the agent is travelling and the travel target is not the home sphere,
+		# count the agent as "travelling"
+		elif not self.travel_arrived:
+			return "travelling"
+		# If the agent is travelling and has arrived, count the agent as "visiting"
+		else:
+			return "visiting"
+
 	def init_sound(self, sound_mean):
 		# Generate the initial sound which will be the only sound in the sound repository
 		borders = { "left": sound_mean - self.model.sound_mean_interval,
@@ -117,18 +261,26 @@ class BorderAgent(Agent):
 			borders["right"] = 1
 
 		if sound_mean > 0.1:
-			initial_sound = round(self.model.random.uniform(borders["left"], borders["right"]), 9)
+			initial_sound = round(self.model.placement_random.uniform(borders["left"], borders["right"]), 9)
 		else:
 			initial_sound = sound_mean
 
+		initial_sound = self.model.sound_storage.encode(initial_sound)
+
 		if not self.model.init_big_inventory:
 			self.sound_repository.append(initial_sound)
 		else:
-			self.sound_repository += [initial_sound] * 140
+			self.sound_repository += self.model.sound_storage.repository([initial_sound] * 140)
+
+		if self.model.sound_histograms:
+			self.model.sound_histograms.add(self.influence_sphere.index, initial_sound, len(self.sound_repository))
 
 	def step(self):
 		self.travel_chance_time()
 		self.move() # TODO: repeat this a number of times probably -- refer to Stanford & Kenny (p. 127)
+		self.converse()
+
+	def converse(self):
 		self.speak()
 
 		if self.media_receptiveness:
@@ -140,13 +292,57 @@ class BorderAgent(Agent):
 		if self.travel_sphere:
 			return
 
+		# The travel chance time has been drawn in advance
+		if self.model.event_driven_travel:
+			if self.travel_event_due("domestic"):
+				self.set_travel_sphere(abroad=False)
+			elif self.travel_event_due("abroad"):
+				self.set_travel_sphere(abroad=True)
+			return
+
 		# Check if travel chance time happens (when number is lower than the model threshold)
-		if self.model.random.random() < self.domestic_travel_chance:
+		if self.model.travel_random.random() < self.domestic_travel_chance:
 			self.set_travel_sphere(abroad=False)
 		# Check if ABROAD travel chance time happens
-		elif self.model.random.random() < self.abroad_travel_chance:
+		elif self.model.travel_random.random() < self.abroad_travel_chance:
 			self.set_travel_sphere(abroad=True)
 
+	# Event-driven travel
+	# Instead of drawing the travel, home and return chances every step, the agent draws the step at which the next of
+	# these events will happen: the number of steps until the first success is geometrically distributed. At home, the
+	# travel and home events compete, so one waiting time is drawn for "any of them" and the event is picked afterwards
+	# in proportion to its chance. Travelling agents have no event, their arrival follows from the path.
+	def schedule_travel_event(self, first_step):
+		self.travel_event = None
+		self.travel_event_step = None
+
+		if not self.travel_sphere:
+			travel_chance = self.domestic_travel_chance + (1 - self.domestic_travel_chance) * self.abroad_travel_chance
+			event_chance = 1 - (1 - travel_chance) * (1 - self.model.home_chance)
+		elif self.travel_arrived:
+			event_chance = self.model.return_chance
+		else:
+			return
+
+		if event_chance <= 0:
+			return
+
+		self.travel_event_step = first_step + geometric_wait(self.model.travel_random, event_chance)
+
+		if self.travel_sphere:
+			self.travel_event = "return"
+		else:
+			event = self.model.travel_random.random() * event_chance
+			if event < self.domestic_travel_chance:
+				self.travel_event = "domestic"
+			elif event < travel_chance:
+				self.travel_event = "abroad"
+			else:
+				self.travel_event = "home"
+
+	def travel_event_due(self, event):
+		return self.travel_event == event and self.travel_event_step == self.model.schedule.steps
+
 	# Set a travel sphere
 	def set_travel_sphere(self, abroad=False):
 		# Travel chance time is happening
@@ -154,17 +350,17 @@ class BorderAgent(Agent):
 		# Current implementation = random influence sphere FROM SAME OR NEIGHBOURING COUNTRY
 		# with probabilities based on radiation model (see infra)
 		while True:
-			travel_sphere = self.random.choice(self.model.influence_spheres)
+			travel_sphere = self.model.travel_random.choice(self.model.influence_spheres)
 			# Keep picking a travel sphere until we've found one that isn't our home sphere
 			# I don't know whether this is more efficient than removing the home sphere from 
 			# a deepcopy of the list of all spheres but I assume this is better
 			if travel_sphere != self.influence_sphere:
 				# Country check
-				if (not abroad and travel_sphere.country == self.influence_sphere.country) or \
-					(abroad and travel_sphere.country != self.influence_sphere.country):
+				if (not abroad and travel_sphere.country_code == self.country) or \
+					(abroad and travel_sphere.country_code != self.country):
 
 					# Travel probabilities check
-					if self.model.random.random() < \
+					if self.model.travel_random.random() < \
 						self.model.travel_probabilities[(self.influence_sphere.name, travel_sphere.name)]:
 						self.travel_sphere = travel_sphere # set current travel target to target travel sphere
 						self.set_travel_path()
@@ -254,6 +450,12 @@ class BorderAgent(Agent):
 		sys.exit(0)
 
 	def set_travel_path(self):
+		# With route tables, trips from a sphere cell look their path up (see BorderRoutes.py)
+		if self.model.routes:
+			self.path = self.model.routes.path(self.pos, self.travel_sphere)
+			if self.path is not None:
+				return
+
 		a = { "x": self.pos[0], "y": self.pos[1] }
 		b = { "x": self.travel_sphere.x, "y": self.travel_sphere.y }
 
@@ -262,12 +464,21 @@ class BorderAgent(Agent):
 	# All movement related code 
 	def move(self):
 		# TODO: use Moore or not? (Moore = diagonal -- currently using Von Neumann)
-		possible_steps = self.model.grid.get_neighborhood(self.pos, moore=False, include_center=True)
+		possible_steps = self.model.get_neighbourhood(self.pos, moore=False)
+
+		self.model.grid.move_agent(self, self.choose_step(possible_steps))
+
+	# Decide on the next position (None when wandering in batched movement, see BorderModel.move_agents)
+	def choose_step(self, possible_steps):
+		# In event-driven mode, the next travel event is drawn again whenever one happens or the agent arrives
+		event_due = self.model.event_driven_travel and self.travel_event_step == self.model.schedule.steps
+		arrived = False
 		
 		# If not travelling, wander
 		if not self.travel_sphere:
 			# Every once in a while, an agent should attempt to return home
-			if self.model.random.random() < self.model.home_chance:
+			if self.travel_event_due("home") if self.model.event_driven_travel else \
+			   self.model.travel_random.random() < self.model.home_chance:
 				new_position = self.home(possible_steps)
 			else:
 				new_position = self.wander(possible_steps)
@@ -280,6 +491,7 @@ class BorderAgent(Agent):
 				if len(self.path) == 0:
 					# 1. set travel status to arrived
 					self.travel_arrived = True
+					arrived = True
 
 					# If we have returned home, reset everything
 					if self.travel_sphere == self.influence_sphere:
@@ -293,17 +505,25 @@ class BorderAgent(Agent):
 					new_position = self.travel(possible_steps)
 			else:
 				# Check if we ought to return home (when number is lower than the model threshold)
-				if self.model.random.random() < self.model.return_chance:
+				if self.travel_event_due("return") if self.model.event_driven_travel else \
+				   self.model.travel_random.random() < self.model.return_chance:
 					# We just initiate a new travel, but this time with the home sphere as the target
 					new_position = self.home(possible_steps)
 				else:
 					new_position = self.wander(possible_steps)
 
-		self.model.grid.move_agent(self, new_position)		
+		if self.model.event_driven_travel and (event_due or arrived):
+			self.schedule_travel_event(self.model.schedule.steps + 1)
+
+		return new_position
 
 	# Code for strolling around casually
 	def wander(self, possible_steps):
-		return self.random.choice(possible_steps)
+		# In batched movement, the model draws the steps of all wandering agents at once
+		if possible_steps is None:
+			return None
+
+		return self.model.movement_random.choice(possible_steps)
 
 		# This code can be used to prevent agents from leaving their influence sphere
 		# It is disabled through the return statement above, because it is no longer needed
@@ -369,15 +589,15 @@ class BorderAgent(Agent):
 		# Agents do not *return* a sound -> media are one-sided
 		# Agents in Belgium get influenced by Dutch media as well
 		# (Flemings listened to Dutch radio stations / watched Dutch television extensively in the past)
-		if self.model.random.random() < self.media_receptiveness:
+		if self.model.media_random.random() < self.media_receptiveness:
 			# People in The Netherlands rarely watch Belgian television
 			# For Dutch people, we always assign The Netherlands as the source country for media influence
-			if self.influence_sphere.country == "The Netherlands":
-				chosen_country = "The Netherlands"
+			if self.country == THE_NETHERLANDS:
+				chosen_country = THE_NETHERLANDS
 			# People in Flanders are avid watchers of Dutch television
 			else:
 				# For Dutch programmes, the ratio should be 1/4 for Dutch television
-				chosen_country = "The Netherlands" if self.model.random.random() <= 0.25 else "Belgium"
+				chosen_country = THE_NETHERLANDS if self.model.media_random.random() <= 0.25 else BELGIUM
 
 			# Add to sound repository
 			self.adopt_sound(self.model.get_central_sound(chosen_country), chosen_country)
@@ -386,17 +606,19 @@ class BorderAgent(Agent):
 	# Speaking-related code
 	def speak(self):
 		# For the neighbours we *do* want to be using the Moore specification, and also the center (there could be someone we share the space with)
-		neighbourhood = self.model.grid.get_neighborhood(self.pos, moore=True, include_center=True)
+		neighbourhood = self.model.get_neighbourhood(self.pos, moore=True)
 		neighbours = self.model.grid.get_cell_list_contents(neighbourhood)
 		if len(neighbours) > 1:
 			# Select one neighbour
-			neighbour = self.model.random.choice(neighbours)
+			neighbour = self.model.conversation_random.choice(neighbours)
 			
 			# This agent speaks, and the neighbour agent saves the sound
-			spoken_sound = self.model.random.choice(self.sound_repository)
+			spoken_sound = self.model.conversation_random.choice(self.sound_repository)
+			if self.model.fixed_point_sounds:
+				spoken_sound = self.model.sound_storage.decode(spoken_sound)
 
 			# Add spoken sound to neighbour's sound repository
-			neighbour.adopt_sound(spoken_sound, self.influence_sphere.country)
+			neighbour.adopt_sound(spoken_sound, self.country)
 
 			# Set this agent's spoken state to True
 			self.has_spoken = True
@@ -406,16 +628,21 @@ class BorderAgent(Agent):
 		adoption_count = 1
 
 		# If the sound origin country is not the home country, implement the ethnocentrism
-		if sound_origin_country != self.influence_sphere.country:
+		if sound_origin_country != self.country:
 			# The higher the ethnocentrism value, the less likely an agent is to adopt the foreign variant
-			if self.model.random.random() < self.ethnocentrism:
+			if self.model.conversation_random.random() < self.ethnocentrism:
 				return
 
 		# Make sure the shift *always* happens for the Netherlands
-		if self.influence_sphere.country == "The Netherlands" and sound_origin_country == "The Netherlands":
+		if self.country == THE_NETHERLANDS and sound_origin_country == THE_NETHERLANDS:
 			# If the sound to be received is lower than the current average sound, don't take over this sound
 			# I know this is circular, but that's the point -- the shift in the Netherlands is a given, not something I want to test
-			if sound < statistics.mean(self.sound_repository):
+			if self.model.fixed_point_sounds:
+				repository_mean = self.model.sound_storage.mean(self.sound_repository)
+			else:
+				repository_mean = statistics.mean(self.sound_repository)
+
+			if sound < repository_mean:
 				return
 
 			# If target acceleration is activated, set the adoption count to the acceleration count defined in the model parameters
@@ -424,8 +651,12 @@ class BorderAgent(Agent):
 
 		# If the sound origin country is the home country, or the ethnocentrism wasn't a big enough influence this time,
 		# just adopt the sound as much as required
+		stored_sound = self.model.sound_storage.encode(sound) if self.model.fixed_point_sounds else sound
 		for adoption_turn in range(adoption_count):
-			self.sound_repository.append(sound)
+			self.sound_repository.append(stored_sound)
+
+		if self.model.sound_histograms:
+			self.model.sound_histograms.add(self.influence_sphere.index, stored_sound, adoption_count)
 
 class BorderModel(Model):
 	def __init__(self, width, height, return_chance=0.05, home_chance=0.005,
@@ -440,15 +671,32 @@ class BorderModel(Model):
 					   sound_mean_interval=0.1, decay_limit=140,
 					   border_heights=[ 74, 54 ],
 					   init_big_inventory=False,
-					   target_accel_count=False):
+					   target_accel_count=False,
+					   spheres_file="spheres.json",
+					   shared_data=None,
+					   route_tables=False,
+					   route_cache=None,
+					   sound_storage="float",
+					   histogram_bins=None,
+					   raster_interval=None,
+					   event_driven_travel=False,
+					   batched_movement=False,
+					   batched_speech=False,
+					   activation=None,
+					   activation_batches=10,
+					   separate_streams=False,
+					   seed=None):
 
 		self.width = width
 		self.height = height
 
+		# Every model gets its own random number generator (mesa's is shared by all models of a class)
+		self.random = random.Random(seed)
+
 		self.num_agents = 0
 
 		# Program the border so it always starts on the horizontal borders (only the y axis is controllable)
-		self.border_coords = [ (0, border_heights[0]), (width, border_heights[1]) ]
+		self.border_coords = border_coords(width, border_heights)
 		self.set_border_longest_distance()
 
 		self.grid = MultiGrid(width, height, False)
@@ -472,8 +720,55 @@ class BorderModel(Model):
 
 		self.init_big_inventory = init_big_inventory
 		self.target_accel_count = target_accel_count
+		self.event_driven_travel = event_driven_travel # draw waiting times for travel events (see BorderAgent.schedule_travel_event)
+		self.batched_movement = batched_movement # move all agents before anyone speaks (see move_agents)
+		self.batched_speech = batched_speech # all conversations of a step at once (see BorderSpeech.py)
+		self.neighbourhood_tables = {}
+
+		# How agents are activated every step (see activate_agents), batched movement and speech need a staged mode
+		if activation is None:
+			activation = "staged" if batched_movement or batched_speech else "random"
+		if activation not in ACTIVATION_MODES:
+			raise ValueError("Unknown activation mode '{}', choose from: {}".format(activation, ", ".join(ACTIVATION_MODES)))
+		if activation == "random" and (batched_movement or batched_speech):
+			raise ValueError("Batched movement and speech need the staged or batches activation mode")
+		self.activation = activation
+		self.activation_batches = activation_batches
+
+		self.separate_streams = separate_streams
+		self.init_random_streams(seed)
+
+		self.spheres_file = spheres_file # JSON file which describes the influence spheres (see BorderScenario.py)
+		self.sound_storage = SoundStorage(sound_storage) # how sound repositories are stored (see BorderStorage.py)
+		# Only fixed point formats need encoding, decoding and scaled means, the others are used as they are on every speech act
+		self.fixed_point_sounds = self.sound_storage.fixed_point
+
+		# Read-only data shared between sweep workers (see BorderShared.py)
+		self.shared_data = None
+		if shared_data:
+			self.shared_data = attach_model_data(shared_data)
+			self.shared_data.check(width, height, spheres_file)
 
 		self.init_influence_spheres()
+
+		# Paths from every sphere cell to every sphere, kept in route_cache if given (see BorderRoutes.py)
+		self.route_tables = route_tables
+		self.route_cache = route_cache
+		self.routes = None
+		if route_tables:
+			self.init_routes()
+
+		# Incrementally updated sound histograms for the distribution reporters (see BorderHistogram.py)
+		self.histogram_bins = histogram_bins
+		self.sound_histograms = None
+		if histogram_bins:
+			self.sound_histograms = SoundHistograms(histogram_bins, self.influence_spheres, self.sound_storage)
+
+		# Spatial snapshots of the sounds every raster_interval steps (see BorderRaster.py)
+		self.sound_rasters = None
+		if raster_interval:
+			self.sound_rasters = SoundRasters(width, height, raster_interval)
+
 		self.init_agents()
 		self.compute_radiation_probabilities()
 		self.collect_data_bulk()
@@ -483,34 +778,35 @@ class BorderModel(Model):
 
 	# We want to get the longest distance from the border to the top or bottom, depending on the country
 	def set_border_longest_distance(self):
-		self.border_longest_distance = { "The Netherlands": [],
-										 "Belgium": [] }
-
-		# Go over each x coordinate to see which distance is the longest
-		for x in range(0, self.width + 1, 1):
-			nl_point = (x, 0) # Dutch points are calculated from the top
-			be_point = (x, self.height) # Belgium points are calculated form the bottom
-
-			self.border_longest_distance["The Netherlands"].append(distance_to_line(self.border_coords[0],
-																		  self.border_coords[1], nl_point))
-			self.border_longest_distance["Belgium"].append(distance_to_line(self.border_coords[0],
-																		  self.border_coords[1], be_point))
-		
-		self.border_longest_distance = { "The Netherlands": round(max(self.border_longest_distance["The Netherlands"])),
-										 "Belgium": round(max(self.border_longest_distance["Belgium"])) }
+		# Dutch points are calculated from the top, Belgian points from the bottom (see BorderGeometry.py)
+		self.border_longest_distance = border_longest_distance(self.width, self.height, self.border_coords)
 
 	def init_influence_spheres(self):
 		self.influence_spheres = []
 
 		# Create influence spheres
-		with open("spheres.json") as spheres_file:
+		with open(self.spheres_file) as spheres_file:
 			spheres = json.load(spheres_file)
 
 		# Create the influence spheres based on the info in the dict above
-		for sphere in spheres:
-			influence_sphere = InfluenceSphere(**sphere)
+		for index, sphere in enumerate(spheres):
+			if self.shared_data:
+				influence_sphere = InfluenceSphere(**sphere, coordinates=self.shared_data.sphere_coordinates(sphere["name"]))
+			else:
+				influence_sphere = InfluenceSphere(**sphere)
+			influence_sphere.index = index
 			self.influence_spheres.append(influence_sphere)
 
+		self.influence_spheres_by_name = { influence_sphere.name: influence_sphere for influence_sphere in self.influence_spheres }
+
+	def init_routes(self):
+		if self.shared_data and "route_rows" in self.shared_data.arrays:
+			arrays = self.shared_data.arrays
+		else:
+			arrays = load_route_table(self.width, self.height, self.influence_spheres, self.route_cache)
+
+		self.routes = RouteTable(arrays, self.height, len(self.influence_spheres))
+
 	def init_agents(self):
 		# Create agents based on population count in the influence spheres
 		agent_no = 0
@@ -518,7 +814,8 @@ class BorderModel(Model):
 			# Create agents
 			for i in range(influence_sphere.population):
 				# Define a location for this agent (we need to know this beforehand to be able to seed ethnocentrism)
-				location = self.random.choice(influence_sphere.coordinates)
+				location = self.placement_random.choice(influence_sphere.coordinates)
+				location = (int(location[0]), int(location[1]))
 
 				# Assign value for ethnocentrism based on whether it is seeded or not
 				if self.scaled_ethnocentrism:
@@ -546,6 +843,10 @@ class BorderModel(Model):
 
 		self.num_agents = agent_no
 
+		if self.event_driven_travel:
+			for agent in self.schedule.agents:
+				agent.schedule_travel_event(self.schedule.steps)
+
 	def init_data_collect(self):
 		# Initialise the data collector which will be used for graphing and stats
 		model_reporters = { "home": lambda model: model.whereabouts_data["home"],
@@ -559,6 +860,17 @@ class BorderModel(Model):
 			model_reporters["sphere_" + influence_sphere.name] = \
 				build_sound_mean_lambda_new(influence_sphere.name)
 
+		# Distribution reporters, e.g. median_nl, bimodality_be, sphere_Antwerpen_variance
+		if self.sound_histograms:
+			for country, suffix in COUNTRY_SUFFIXES.items():
+				for statistic in [ "q10", "median", "q90", "variance", "bimodality" ]:
+					model_reporters[statistic + "_" + suffix] = build_distribution_lambda(country, statistic)
+
+			for influence_sphere in self.influence_spheres:
+				for statistic in [ "median", "variance" ]:
+					model_reporters["sphere_" + influence_sphere.name + "_" + statistic] = \
+						build_distribution_lambda(influence_sphere.name, statistic)
+
 		self.datacollector = DataCollector(
 			model_reporters=model_reporters)
 
@@ -582,18 +894,7 @@ class BorderModel(Model):
 			# ----
 			# Whereabouts
 			# ----
-
-			# If the agent is not travelling, or they are travelling homewards, count them
-			# as being "home"
-			if not agent.travel_sphere or agent.travel_sphere == agent.influence_sphere:
-				self.whereabouts_data["home"] += 1
-			# If the agent is travelling and the travel target is not the home sphere,
-			# count the agent as "travelling"
-			elif agent.travel_sphere and agent.travel_sphere != agent.influence_sphere and not agent.travel_arrived:
-				self.whereabouts_data["travelling"] += 1
-			# If the agent is travelling and has arrived, count the agent as "visiting"
-			elif agent.travel_sphere and agent.travel_arrived:
-				self.whereabouts_data["visiting"] += 1
+			self.whereabouts_data[agent.whereabouts()] += 1
 
 			# ----
 			# Average sound repository size
@@ -612,19 +913,83 @@ class BorderModel(Model):
 								"Belgium": None }
 		# Compute and set the means
 		for country in self.average_sounds:
-			self.average_sounds[country] = round(statistics.mean(average_sound_repository[country]), 9)
+			self.average_sounds[country] = round(self.sound_storage.mean(average_sound_repository[country]), 9)
 
 		for influence_sphere in self.influence_spheres:
 			self.average_sounds_spheres[influence_sphere.name] = \
-				round(statistics.mean(average_sound_repository_spheres[influence_sphere.name]), 9)
+				round(self.sound_storage.mean(average_sound_repository_spheres[influence_sphere.name]), 9)
+
+		if self.sound_histograms:
+			self.collect_distributions()
+
+		if self.sound_rasters and self.schedule.steps % self.sound_rasters.interval == 0:
+			self.sound_rasters.snapshot(self.schedule.steps, self.schedule.agents, self.sound_storage)
+
+	# Distribution statistics of every country and sphere, straight from the histograms
+	def collect_distributions(self):
+		self.sound_distributions = {}
+		for country in COUNTRIES:
+			sphere_indices = [ influence_sphere.index for influence_sphere in self.influence_spheres \
+							   if influence_sphere.country == country ]
+			self.sound_distributions[country] = distribution_statistics(self.sound_histograms.merged(sphere_indices))
 
-	# Get a sound from a central region to simulate media influence
+		for influence_sphere in self.influence_spheres:
+			self.sound_distributions[influence_sphere.name] = \
+				distribution_statistics(self.sound_histograms.counts[influence_sphere.index])
+
+	# Neighbourhood of a cell, center included (Moore = diagonals included, otherwise Von Neumann)
+	def get_neighbourhood(self, pos, moore):
+		if self.shared_data:
+			return self.shared_data.neighbourhood(pos, moore)
+
+		return self.grid.get_neighborhood(pos, moore=moore, include_center=True)
+
+	# Random number streams
+	# By default, every component draws from the model's random number generator. With separate streams, every component
+	# (see RANDOM_STREAMS) gets its own generator, derived from the seed. Runs with the same seed then share e.g. the
+	# initial placement and the movement draws, even if other parameters make the conversations draw more or fewer
+	# numbers (common random numbers, see BorderThink's --common-random-numbers).
+	def init_random_streams(self, seed):
+		for stream in RANDOM_STREAMS:
+			if not self.separate_streams:
+				setattr(self, stream + "_random", self.random)
+			elif seed is None:
+				setattr(self, stream + "_random", random.Random())
+			else:
+				setattr(self, stream + "_random", random.Random("{}-{}".format(seed, stream)))
+
+		# Batched movement and speech draw with numpy
+		if self.batched_movement or self.batched_speech:
+			if self.separate_streams:
+				self.movement_numpy_random = numpy.random.default_rng(self.movement_random.getrandbits(64))
+				self.conversation_numpy_random = numpy.random.default_rng(self.conversation_random.getrandbits(64))
+			else:
+				self.movement_numpy_random = self.conversation_numpy_random = \
+					numpy.random.default_rng(self.random.getrandbits(64))
+
+	# Neighbourhoods of all cells as an array (see BorderShared.build_neighbourhood_table), built on first use
+	def get_neighbourhood_table(self, moore):
+		if moore not in self.neighbourhood_tables:
+			name = "moore" if moore else "von_neumann"
+			if self.shared_data:
+				self.neighbourhood_tables[moore] = self.shared_data.arrays[name], self.shared_data.arrays[name + "_counts"]
+			else:
+				self.neighbourhood_tables[moore] = build_neighbourhood_table(self.width, self.height, moore=moore)
+
+		return self.neighbourhood_tables[moore]
+
+	# Agents which can be spoken to: the agents of this model, and agents which get their sounds through adopt_sound
+	def speech_listeners(self):
+		return self.schedule.agents, []
+
+	# Get a sound from a central region to simulate media influence (country is a country code)
 	def get_central_sound(self, country):
 		while True:
-			random_agent = self.random.choice(self.schedule.agents)
+			random_agent = self.media_random.choice(self.schedule.agents)
 			# Return a sound if the agent belongs to the country we want and if their region is central
-			if random_agent.influence_sphere.country == country and random_agent.influence_sphere.central:
-				return self.random.choice(random_agent.sound_repository)
+			if random_agent.country == country and random_agent.influence_sphere.central:
+				sound = self.media_random.choice(random_agent.sound_repository)
+				return self.sound_storage.decode(sound) if self.fixed_point_sounds else sound
 
 	def compute_radiation_probabilities(self):
 		# For each influence sphere, compute the probability of an agent going to another influence sphere
@@ -678,66 +1043,103 @@ class BorderModel(Model):
 											round(probability, 2)))
 
 	def compute_radiation_probabilities(self):
-		# For each influence sphere, compute the probability of an agent going to another influence sphere
-		for influence_sphere_destination in self.influence_spheres:
-			influence_sources = { "The Netherlands": {},
-								  "Belgium": {} }
-			total_influence = { "The Netherlands": 0,
-								  "Belgium": 0 }
+		# Travel probabilities only depend on the spheres, so sweep workers can share them
+		if self.shared_data:
+			self.travel_probabilities = self.shared_data.travel_probabilities
+		else:
+			self.travel_probabilities = radiation_probabilities(self.influence_spheres)
 
-			for influence_sphere_source in self.influence_spheres:
-				# If destination is self, continue
-				if influence_sphere_source == influence_sphere_destination:
-					continue
+	def step(self):
+		self.collect_data_bulk()
+		self.datacollector.collect(self)
+		self.activate_agents()
+		self.reset_agents()
+
+	# Activation modes
+	# random:  every agent moves and speaks in turn, in random order (mesa's RandomActivation)
+	# staged:  first every agent moves, then every agent speaks (both in the same random order)
+	# batches: the agents are split into random batches, within a batch first everyone moves, then everyone speaks
+	def activate_agents(self):
+		if self.activation == "random":
+			self.schedule.step()
+			return
 
-				# Find out the distance between the points we are comparing, then round it
-				spheres_distance = distance_between_points(influence_sphere_source.x, influence_sphere_destination.x,
-														   influence_sphere_source.y, influence_sphere_destination.y)
-				spheres_distance = round(spheres_distance)
+		agents = list(self.schedule.agents)
+		self.random.shuffle(agents)
 
-				# Implementation of:
-				#       P~i~ * P~j~                P~i~
-				# ------------------------- * --------------
-				#          d~ij~²              P~i~ + P~j~
-				influence = ((influence_sphere_source.population * influence_sphere_destination.population) / \
-												(spheres_distance * spheres_distance)) * \
-				((influence_sphere_source.population) / (influence_sphere_source.population + influence_sphere_destination.population))
-
-				# Idea: SOURCE OF INFLUENCE -> DESTINATION OF INFLUENCE
-				# is the result of DESTINATION visiting SOURCE
-				# so: REVERSAL = travel probabilities
-
-				# Save the probability to the a temporary dict
-				influence_sources[influence_sphere_source.country][influence_sphere_source.name] = influence
-				total_influence[influence_sphere_source.country] += influence
-			
-			# Compute probabilities depending on total influence on this sphere
-			for influence_source_country in influence_sources:
-				for influence_source in influence_sources[influence_source_country]:
-					self.travel_probabilities[(influence_sphere_destination.name, influence_source)] = \
-						round(influence_sources[influence_source_country][influence_source] / total_influence[influence_source_country], 2)
+		# The agents are shuffled, so every nth agent makes a random batch
+		if self.activation == "staged":
+			batches = [ agents ]
+		else:
+			batches = [ agents[batch::self.activation_batches] for batch in range(self.activation_batches) ]
 
-		#pp = pprint.PrettyPrinter(indent=4)
-		#pp.pprint(self.travel_probabilities)
+		for batch in batches:
+			if self.batched_movement:
+				self.move_agents(batch)
+			else:
+				for agent in batch:
+					agent.travel_chance_time()
+					agent.move()
 
-	def step(self):
-		self.collect_data_bulk()
-		self.datacollector.collect(self)
-		self.schedule.step()
+			if self.batched_speech:
+				from BorderSpeech import speak_batched
+
+				speak_batched(self, batch)
+				for agent in batch:
+					if agent.media_receptiveness:
+						agent.media_influence()
+			else:
+				for agent in batch:
+					agent.converse()
+
+		self.schedule.steps += 1
+		self.schedule.time += 1
+
+	# Move all agents at once: the travel decisions are still made per agent, but the steps of all wandering agents
+	# are drawn in one go from the Von Neumann neighbourhood table (center included, like BorderAgent.move)
+	def move_agents(self, agents):
+		wanderers = []
+		for agent in agents:
+			agent.travel_chance_time()
+			new_position = agent.choose_step(None)
+			if new_position is None:
+				wanderers.append(agent)
+			elif new_position != agent.pos:
+				self.grid.move_agent(agent, new_position)
+
+		if not wanderers:
+			return
+
+		table, counts = self.get_neighbourhood_table(moore=False)
+		cells = numpy.fromiter((agent.pos[0] * self.height + agent.pos[1] for agent in wanderers), dtype=numpy.int64,
+							   count=len(wanderers))
+		choices = (self.movement_numpy_random.random(len(wanderers)) * counts[cells]).astype(numpy.int64)
+
+		for agent, (x, y) in zip(wanderers, table[cells, choices].tolist()):
+			if (x, y) != agent.pos:
+				self.grid.move_agent(agent, (x, y))
 
+	def reset_agents(self):
 		for agent in self.schedule.agents:
 			# Reset speaking turns for every agent
 			agent.has_spoken = False
 
 			# Decay sound memory
 			if len(agent.sound_repository) > self.decay_limit:
+				if self.sound_histograms:
+					self.sound_histograms.remove_all(agent.influence_sphere.index, agent.sound_repository[:-self.decay_limit])
 				agent.sound_repository = agent.sound_repository[-self.decay_limit:]
 
 class InfluenceSphere():
+	__slots__ = [ "name", "index", "country", "country_code", "x", "y", "radius", "population", "sound_mean", "central",
+				  "coordinates" ]
+
 	# This code generates a list of all coordinates which will be inside the influence sphere
-	def __init__(self, x, y, radius, population=None, sound_mean=None, name=None, country=None, central=None):
+	def __init__(self, x, y, radius, population=None, sound_mean=None, name=None, country=None, central=None, coordinates=None):
 		self.name = name
-		self.country = country
+		self.index = None # position in the model's list of influence spheres
+		self.country = country # only used for display and reporting
+		self.country_code = COUNTRIES.index(country) if country else None
 
 		self.x = x
 		self.y = y
@@ -746,6 +1148,11 @@ class InfluenceSphere():
 		self.sound_mean = sound_mean # the mean around which population values are initialised
 		self.central = central
 
+		# Coordinates can be handed over when they were computed before (see BorderShared.py)
+		if coordinates is not None:
+			self.coordinates = coordinates
+			return
+
 		self.coordinates = []
 
 		for j in range(x - radius, x + radius + 1):
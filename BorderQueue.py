@@ -0,0 +1,308 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from BorderResults import ResultsStore, code_version, job_key, plain_value
+
+# Job queue
+# ---------
+# Spreads the runs of a sweep over any number of worker processes, on one or several hosts, through a table in the
+# results database (see BorderResults.py). BorderThink --queue puts the runs in the queue and waits until they are
+# done; every worker (python3 BorderQueue.py results.db) claims a run, simulates it, stores its frame in the results
+# database and marks it done.
+#
+# A claimed run is leased to its worker for a while. The worker extends the lease as long as the run goes on; if the
+# worker dies, the lease expires and the run goes back to the other workers. A run which fails (or whose lease
+# expires) too often is marked as failed, so a run which kills its worker cannot take down the whole pool. A run which
+# goes over its memory budget is not tried again, and BorderThink goes on without it.
+#
+# Workers need the same code as BorderThink (they only claim runs of their own code version) and the same working
+# directory (sphere files and raster files are relative paths). SQLite locking needs a file system which supports it:
+# a local disk, or a network file system with working locks.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY,
+								  key TEXT UNIQUE NOT NULL,
+								  job TEXT NOT NULL,
+								  max_steps INTEGER NOT NULL,
+								  sweep TEXT,
+								  code_version TEXT NOT NULL,
+								  priority REAL NOT NULL DEFAULT 0,
+								  state TEXT NOT NULL,
+								  worker TEXT,
+								  lease_expires REAL,
+								  attempts INTEGER NOT NULL DEFAULT 0,
+								  error TEXT);
+CREATE INDEX IF NOT EXISTS queue_state ON queue (state, code_version, priority);
+"""
+
+# States of a queued run
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+OVER_BUDGET = "over budget" # failed without further attempts
+
+class JobQueue():
+	def __init__(self, filename, max_attempts=3):
+		self.filename = filename
+		self.max_attempts = max_attempts
+		self.code_version = code_version()
+
+		# Autocommit, transactions are started explicitly
+		self.connection = sqlite3.connect(filename, timeout=60, isolation_level=None)
+		self.connection.executescript(SCHEMA)
+
+	def close(self):
+		self.connection.close()
+
+	def key(self, job, max_steps):
+		return job_key(job, max_steps, self.code_version)
+
+	# Runs with a higher priority are claimed first (BorderThink uses the estimated cost, see BorderSchedule.py).
+	# Runs which are already queued stay as they are, unless they failed (or went over their memory budget).
+	def enqueue(self, jobs, max_steps, sweep=None, priorities=None):
+		if priorities is None:
+			priorities = [ 0 ] * len(jobs)
+
+		self.connection.execute("BEGIN IMMEDIATE")
+		try:
+			for job, priority in zip(jobs, priorities):
+				key = self.key(job, max_steps)
+				self.connection.execute("INSERT OR IGNORE INTO queue (key, job, max_steps, sweep, code_version, priority, state) "
+										"VALUES (?, ?, ?, ?, ?, ?, ?)",
+										(key, json.dumps(job, default=plain_value), max_steps, sweep, self.code_version,
+										 priority, PENDING))
+				self.connection.execute("UPDATE queue SET state = ?, attempts = 0, error = NULL WHERE key = ? AND state IN (?, ?)",
+										(PENDING, key, FAILED, OVER_BUDGET))
+			self.connection.execute("COMMIT")
+		except Exception:
+			self.connection.execute("ROLLBACK")
+			raise
+
+	# Claim the pending (or expired) run with the highest priority, returns (queue id, job, max_steps, sweep) or None
+	def claim(self, worker, lease_seconds):
+		now = time.time()
+
+		self.connection.execute("BEGIN IMMEDIATE")
+		try:
+			# Runs which used up their attempts and whose last lease expired as well are given up on
+			self.connection.execute("UPDATE queue SET state = ?, error = 'lease expired' WHERE state = ? AND lease_expires < ? "
+									"AND attempts >= ?", (FAILED, LEASED, now, self.max_attempts))
+
+			row = self.connection.execute("SELECT id, job, max_steps, sweep FROM queue WHERE code_version = ? AND "
+										  "(state = ? OR (state = ? AND lease_expires < ?)) ORDER BY priority DESC, id LIMIT 1",
+										  (self.code_version, PENDING, LEASED, now)).fetchone()
+			if row is not None:
+				self.connection.execute("UPDATE queue SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+										"WHERE id = ?", (LEASED, worker, now + lease_seconds, row[0]))
+			self.connection.execute("COMMIT")
+		except Exception:
+			self.connection.execute("ROLLBACK")
+			raise
+
+		if row is None:
+			return None
+
+		queue_id, job, max_steps, sweep = row
+		return queue_id, json.loads(job), max_steps, sweep
+
+	# Returns False if the lease was lost (it expired and another worker claimed the run)
+	def extend_lease(self, queue_id, worker, lease_seconds):
+		cursor = self.connection.execute("UPDATE queue SET lease_expires = ? WHERE id = ? AND worker = ? AND state = ?",
+										 (time.time() + lease_seconds, queue_id, worker, LEASED))
+		return cursor.rowcount == 1
+
+	# Only the worker which holds the run can mark it, a worker which lost its lease leaves the run to the worker which
+	# took it over. Both return False if the lease was lost.
+	def complete(self, queue_id, worker):
+		cursor = self.connection.execute("UPDATE queue SET state = ?, lease_expires = NULL, error = NULL WHERE id = ? AND worker = ?",
+										 (DONE, queue_id, worker))
+		return cursor.rowcount == 1
+
+	# A failed run is tried again, until it used up its attempts
+	def fail(self, queue_id, worker, error):
+		cursor = self.connection.execute("UPDATE queue SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, lease_expires = NULL, "
+										 "error = ? WHERE id = ? AND worker = ? AND state != ?",
+										 (self.max_attempts, FAILED, PENDING, error, queue_id, worker, DONE))
+		return cursor.rowcount == 1
+
+	# Number of runs in every state, for the given jobs or for all runs of this code version
+	def states(self, jobs=None, max_steps=None):
+		if jobs is None:
+			rows = self.connection.execute("SELECT state, COUNT(*) FROM queue WHERE code_version = ? GROUP BY state",
+										   (self.code_version,))
+			return dict(rows.fetchall())
+
+		counts = {}
+		for state in self.job_states(jobs, max_steps):
+			counts[state] = counts.get(state, 0) + 1
+
+		return counts
+
+	# State of every job (None if it is not queued)
+	def job_states(self, jobs, max_steps):
+		states = []
+		for job in jobs:
+			row = self.connection.execute("SELECT state FROM queue WHERE key = ?", (self.key(job, max_steps),)).fetchone()
+			states.append(row[0] if row else None)
+
+		return states
+
+	# A run which went over its memory budget fails without further attempts, it would only go over it again
+	def give_up(self, queue_id, worker, error):
+		cursor = self.connection.execute("UPDATE queue SET state = ?, lease_expires = NULL, error = ? WHERE id = ? AND worker = ? "
+										 "AND state != ?", (OVER_BUDGET, error, queue_id, worker, DONE))
+		return cursor.rowcount == 1
+
+	def error(self, job, max_steps):
+		row = self.connection.execute("SELECT error FROM queue WHERE key = ?", (self.key(job, max_steps),)).fetchone()
+		return row[0] if row else None
+
+# Keeps extending the lease of a run while it is simulated (with its own connection, SQLite connections stay in
+# their own thread)
+class LeaseKeeper(threading.Thread):
+	def __init__(self, filename, queue_id, worker, lease_seconds):
+		super().__init__(daemon=True)
+		self.filename = filename
+		self.queue_id = queue_id
+		self.worker = worker
+		self.lease_seconds = lease_seconds
+		self.finished = threading.Event()
+
+	def run(self):
+		queue = JobQueue(self.filename)
+		while not self.finished.wait(self.lease_seconds / 3):
+			if not queue.extend_lease(self.queue_id, self.worker, self.lease_seconds):
+				print("Lost the lease of queued run {}".format(self.queue_id))
+				break
+		queue.close()
+
+	def stop(self):
+		self.finished.set()
+		self.join()
+
+# Claim and simulate runs until the queue has no open runs left (exit_when_done) or forever
+def work(filename, lease_seconds=600, poll_seconds=10, exit_when_done=False):
+	# Imported here, so the queue itself can be used without loading the model
+	from BorderBands import BandedBorderModel
+	from BorderMemory import MemoryBudgetExceeded
+	from BorderModel import BorderModel
+	from BorderSweep import run_job
+
+	worker = "{}:{}".format(socket.gethostname(), os.getpid())
+	queue = JobQueue(filename)
+	store = ResultsStore(filename)
+
+	print("Worker {} waiting for runs in {}".format(worker, filename))
+
+	try:
+		while True:
+			claimed = queue.claim(worker, lease_seconds)
+
+			if claimed is None:
+				states = queue.states()
+				if exit_when_done and not states.get(PENDING) and not states.get(LEASED):
+					break
+
+				time.sleep(poll_seconds)
+				continue
+
+			queue_id, job, max_steps, sweep = claimed
+			model_class = BandedBorderModel if job["fixed_params"].get("bands", 1) > 1 else BorderModel
+
+			lease_keeper = LeaseKeeper(filename, queue_id, worker, lease_seconds)
+			lease_keeper.start()
+			try:
+				run_frame = run_job(model_class, job, max_steps)
+			except MemoryBudgetExceeded as error:
+				print("Run {} of {} went over its memory budget: {}".format(job["run"], sweep, error))
+				queue.give_up(queue_id, worker, str(error))
+				continue
+			except Exception:
+				print("Run {} of {} failed".format(job["run"], sweep))
+				queue.fail(queue_id, worker, traceback.format_exc())
+				continue
+			finally:
+				lease_keeper.stop()
+
+			# Storing twice is harmless, so a run which was also finished by a worker which took over an expired
+			# lease is simply stored once
+			store.store_run(job, max_steps, run_frame, sweep=sweep, seconds=job["seconds"])
+			if not queue.complete(queue_id, worker):
+				print("Run {} of {} finished in {:.1f} s, but its lease went to another worker".format(job["run"], sweep, job["seconds"]))
+				continue
+
+			print("Run {} of {} finished in {:.1f} s".format(job["run"], sweep, job["seconds"]))
+	finally:
+		queue.close()
+		store.close()
+
+# Wait until the queued jobs are done, yields (job, data collector frame) pairs as the runs are done, so the caller
+# does not need to hold all frames at once. A progress line (see BorderTelemetry.py) is updated for every run. Runs
+# which failed or went over their memory budget are printed and left out (their reason is in job["error"]), like in
+# BorderSweep.run_sweep; runs which failed for any other reason than their budget are added to failed_runs as well.
+def wait_for_jobs(queue, store, jobs, max_steps, poll_seconds=10, progress_line=None, failed_runs=None):
+	open_jobs = jobs
+	closed_states = {} # number of runs which are done, failed or over their budget, which are not looked at again
+	last_states = None
+	while True:
+		job_states = queue.job_states(open_jobs, max_steps)
+
+		states = dict(closed_states)
+		for state in job_states:
+			states[state] = states.get(state, 0) + 1
+		if states != last_states:
+			print("Queue: {}".format(", ".join("{} {}".format(count, state) for state, count in sorted(states.items(), key=str))))
+			last_states = states
+
+		still_open = []
+		for job, state in zip(open_jobs, job_states):
+			if state == DONE:
+				closed_states[DONE] = closed_states.get(DONE, 0) + 1
+				if progress_line:
+					progress_line.update(job)
+				yield job, store.load_run(job, max_steps)
+			elif state in (FAILED, OVER_BUDGET):
+				closed_states[state] = closed_states.get(state, 0) + 1
+				job["error"] = queue.error(job, max_steps)
+				if progress_line:
+					progress_line.update(job)
+				print("Run {} failed: {}".format(job["run"], job["error"]))
+
+				if state == FAILED and failed_runs is not None:
+					failed_runs.append(job)
+			else:
+				still_open.append(job)
+		open_jobs = still_open
+
+		if not states.get(PENDING) and not states.get(LEASED):
+			break
+
+		time.sleep(poll_seconds)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="BorderQueue - worker which simulates the runs queued by BorderThink --queue")
+	parser.add_argument('database', type=str, help="Results database which holds the queue")
+	parser.add_argument('--workers', type=int, default=1, help="Number of worker processes to start (default: 1)")
+	parser.add_argument('--lease', type=int, default=600, help="Seconds a claimed run is leased, the lease is extended while the run goes on (default: 600)")
+	parser.add_argument('--poll', type=int, default=10, help="Seconds between looks at an empty queue (default: 10)")
+	parser.add_argument('--exit-when-done', action='store_true', help="Stop when the queue has no open runs left, instead of waiting for more")
+
+	args = parser.parse_args()
+
+	if args.workers == 1:
+		work(args.database, args.lease, args.poll, args.exit_when_done)
+	else:
+		processes = [ multiprocessing.Process(target=work, args=(args.database, args.lease, args.poll, args.exit_when_done)) \
+					  for worker in range(args.workers) ]
+		for process in processes:
+			process.start()
+		for process in processes:
+			process.join()
@@ -0,0 +1,71 @@
+import numpy
+
+# Spatial sound rasters
+# ---------------------
+# Every interval steps, the mean sound of the agents in every cell (and the number of agents in it) is binned into a
+# width x height raster. The rasters of a run are written to one compressed .npz file:
+#
+#   steps        (snapshots,)                  step of every snapshot
+#   mean_sound   (snapshots, width, height)    mean of the agents' mean sounds, NaN for empty cells (float32)
+#   density      (snapshots, width, height)    number of agents (uint32)
+#   border_coords                               begin and end point of the border
+#
+# Rasters are indexed [x, y] like the grid, so row 0 of the transposed raster is the top (Dutch) edge.
+
+class SoundRasters():
+	def __init__(self, width, height, interval):
+		self.width = width
+		self.height = height
+		self.interval = interval
+
+		# The snapshots are kept in their saved form (8 bytes per cell), in arrays which double in size when full
+		self.steps = []
+		self.mean_sound = numpy.empty((0, width, height), dtype=numpy.float32)
+		self.density = numpy.empty((0, width, height), dtype=numpy.uint32)
+
+	# Sum of mean sounds and number of agents per cell, flattened (index x * height + y)
+	def partial(self, agents, sound_storage):
+		cells = numpy.empty(len(agents), dtype=numpy.int64)
+		sounds = numpy.empty(len(agents))
+
+		for i, agent in enumerate(agents):
+			cells[i] = agent.pos[0] * self.height + agent.pos[1]
+			sounds[i] = sound_storage.total(agent.sound_repository) / len(agent.sound_repository)
+
+		return numpy.bincount(cells, weights=sounds, minlength=self.width * self.height), \
+			   numpy.bincount(cells, minlength=self.width * self.height)
+
+	def snapshot(self, step, agents, sound_storage):
+		self.add(step, *self.partial(agents, sound_storage))
+
+	def add(self, step, sums, counts):
+		# The model collects its data twice at step 0, the last collection wins
+		if self.steps and self.steps[-1] == step:
+			index = len(self.steps) - 1
+		else:
+			index = len(self.steps)
+			if index == len(self.mean_sound):
+				self.grow()
+			self.steps.append(step)
+
+		with numpy.errstate(invalid="ignore", divide="ignore"):
+			self.mean_sound[index] = (sums / counts).reshape(self.width, self.height)
+		self.density[index] = counts.reshape(self.width, self.height)
+
+	def grow(self):
+		capacity = max(16, 2 * len(self.mean_sound))
+
+		mean_sound = numpy.empty((capacity, self.width, self.height), dtype=numpy.float32)
+		mean_sound[:len(self.steps)] = self.mean_sound[:len(self.steps)]
+		self.mean_sound = mean_sound
+
+		density = numpy.empty((capacity, self.width, self.height), dtype=numpy.uint32)
+		density[:len(self.steps)] = self.density[:len(self.steps)]
+		self.density = density
+
+	def save(self, filename, border_coords):
+		numpy.savez_compressed(filename,
+							   steps=numpy.array(self.steps, dtype=numpy.int32),
+							   mean_sound=self.mean_sound[:len(self.steps)],
+							   density=self.density[:len(self.steps)],
+							   border_coords=numpy.array(border_coords))
@@ -0,0 +1,142 @@
+import concurrent.futures
+import json
+
+import tornado.escape
+import tornado.ioloop
+import tornado.websocket
+
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+
+# Rendering pipeline for several viewers
+# --------------------------------------
+# mesa's server steps and renders the model on the tornado event loop, once for every viewer which asks for a step,
+# so a slow step or render holds up every viewer. RenderingServer hands stepping, rendering and serializing to a single
+# worker thread (the model is never touched by two threads at once), and the event loop only passes messages:
+#
+#   - Every frame is rendered and serialized once, and the same message goes to every viewer waiting for a frame.
+#   - A viewer which asks for a step while there is a newer frame than the last one it got, gets that frame instead
+#     of stepping the shared model again, so several viewers watch the same run at the pace of the fastest one.
+#   - A viewer only gets a new frame once the previous one was written to its connection. Until then only the newest
+#     frame is kept for it, older ones are dropped, so a slow connection gets fewer frames instead of a growing backlog.
+#
+# Frames are only sent to viewers which asked for one: the mesa client asks for the next step after every frame it
+# draws, so frames it did not ask for would make it ask faster and faster.
+
+class FrameSocketHandler(SocketHandler):
+	def open(self):
+		self.waiting_for = None # number of the frame it asked for, until it gets that frame or a newer one
+		self.writing = False # a frame is being written to the connection
+		self.pending_frame = None # newest frame which came in while writing
+		self.last_frame = 0 # number of the last frame written
+
+		self.application.viewers.add(self)
+		super().open()
+
+	def on_close(self):
+		self.application.viewers.discard(self)
+
+	def on_message(self, message):
+		msg = tornado.escape.json_decode(message)
+
+		if msg["type"] == "get_step":
+			if self.application.verbose:
+				print(message)
+			self.application.request_frame(self)
+		elif msg["type"] == "reset":
+			if self.application.verbose:
+				print(message)
+			self.application.request_frame(self, reset=True)
+		else:
+			super().on_message(message)
+
+	def send_frame(self, frame):
+		self.waiting_for = None
+
+		if self.writing:
+			self.pending_frame = frame
+		else:
+			self.write_frame(frame)
+
+	def write_frame(self, frame):
+		number, message = frame
+
+		try:
+			future = self.write_message(message)
+		except tornado.websocket.WebSocketClosedError:
+			return
+
+		self.writing = True
+		self.last_frame = number
+		future.add_done_callback(self.frame_written)
+
+	def frame_written(self, future):
+		self.writing = False
+
+		# The connection was closed while writing
+		if future.exception() is not None:
+			return
+
+		if self.pending_frame is not None:
+			frame, self.pending_frame = self.pending_frame, None
+			self.write_frame(frame)
+
+class RenderingServer(ModularServer):
+	socket_handler = (r"/ws", FrameSocketHandler)
+	handlers = [ ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler ]
+
+	def __init__(self, *args, **kwargs):
+		self.viewers = set()
+		self.frame = None # (number, serialized viz_state message) of the newest frame
+		self.frames_requested = 0 # frames are numbered in the order they were requested
+		self.frames_in_progress = 0
+		self.worker = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+
+		super().__init__(*args, **kwargs)
+
+	def request_frame(self, viewer, reset=False):
+		if not reset and self.frame is not None and self.frame[0] > viewer.last_frame:
+			viewer.send_frame(self.frame)
+			return
+
+		# A step which is already on its way gives the viewer a newer frame as well, a reset always goes through
+		if reset or self.frames_in_progress == 0:
+			self.frames_requested += 1
+			self.frames_in_progress += 1
+			tornado.ioloop.IOLoop.current().spawn_callback(self.render_frame, self.frames_requested, reset)
+
+		viewer.waiting_for = self.frames_requested
+
+	# The worker renders the frames one by one, in the order they were requested
+	async def render_frame(self, number, reset):
+		try:
+			message = await tornado.ioloop.IOLoop.current().run_in_executor(self.worker, self.step_and_render, reset)
+		finally:
+			self.frames_in_progress -= 1
+
+		waiting_viewers = [ viewer for viewer in self.viewers if viewer.waiting_for is not None and viewer.waiting_for <= number ]
+
+		# The model has finished
+		if message is None:
+			for viewer in waiting_viewers:
+				viewer.waiting_for = None
+				try:
+					viewer.write_message({ "type": "end" })
+				except tornado.websocket.WebSocketClosedError:
+					pass
+			return
+
+		self.frame = (number, message)
+
+		for viewer in waiting_viewers:
+			viewer.send_frame(self.frame)
+
+	# In the worker thread
+	def step_and_render(self, reset):
+		if reset:
+			self.reset_model()
+		elif not self.model.running:
+			return None
+		else:
+			self.model.step()
+
+		return json.dumps({ "type": "viz_state", "data": self.render_model() })
@@ -0,0 +1,81 @@
+import json
+
+import numpy
+import pandas
+
+from BorderResults import plain_value
+from BorderSweep import report_parameters, job_report
+
+# Sweep reports
+# -------------
+# csv: one semicolon separated text file, every parameter repeated on every row (the original format)
+# npz: compressed numpy arrays, every reporter as a float32 column and the parameters stored once per run
+#
+#   report_columns    JSON list of all columns of the report, in order
+#   reporters         JSON list of the reporter columns
+#   runs              JSON list of the parameter columns of every run, [ [ column, value ], ... ]
+#   run_rows          number of rows (steps) of every run
+#   step              step of every row
+#   reporter<i>       values of reporter i for every row
+#
+# load_report reads both formats into the same pandas frame (indexed by step).
+
+REPORT_FORMATS = [ "csv", "npz" ]
+
+# Keep every step_stride-th step of a run, and its last step
+def decimate(run_frame, step_stride):
+	if step_stride == 1:
+		return run_frame
+
+	steps = run_frame.index.to_numpy()
+	return run_frame[(steps % step_stride == 0) | (steps == steps[-1])]
+
+def write_csv_report(runs, filename, step_stride=1):
+	mother_panda = pandas.concat([ job_report(job, decimate(run_frame, step_stride).copy()) for job, run_frame in runs ])
+	mother_panda.to_csv(filename, sep=";")
+
+def write_npz_report(runs, filename, step_stride=1):
+	run_frames = [ decimate(run_frame, step_stride) for job, run_frame in runs ]
+	reporters = list(run_frames[0].columns)
+	parameters = [ [ [ column, value ] for column, value in report_parameters(job) ] for job, run_frame in runs ]
+
+	arrays = { "report_columns": json.dumps(reporters + [ column for column, value in parameters[0] ]),
+			   "reporters": json.dumps(reporters),
+			   "runs": json.dumps(parameters, default=plain_value),
+			   "run_rows": numpy.array([ len(run_frame) for run_frame in run_frames ], dtype=numpy.int32),
+			   "step": numpy.concatenate([ run_frame.index.to_numpy() for run_frame in run_frames ]).astype(numpy.int32) }
+
+	for i, reporter in enumerate(reporters):
+		arrays["reporter{}".format(i)] = numpy.concatenate([ run_frame[reporter].to_numpy(dtype=numpy.float32) for run_frame in run_frames ])
+
+	numpy.savez_compressed(filename, **arrays)
+
+def write_report(runs, filename, report_format="csv", step_stride=1):
+	if report_format == "csv":
+		write_csv_report(runs, filename, step_stride)
+	elif report_format == "npz":
+		write_npz_report(runs, filename, step_stride)
+	else:
+		raise ValueError("Unknown report format '{}', choose from: {}".format(report_format, ", ".join(REPORT_FORMATS)))
+
+def load_npz_report(filename):
+	arrays = numpy.load(filename)
+	reporters = json.loads(str(arrays["reporters"]))
+	runs = json.loads(str(arrays["runs"]))
+	run_rows = arrays["run_rows"]
+
+	frame = pandas.DataFrame({ reporter: arrays["reporter{}".format(i)] for i, reporter in enumerate(reporters) },
+							 index=pandas.Index(arrays["step"], name="step"))
+
+	# Expand the parameters of every run over its rows (empty parameters become NaN, like in the CSV report)
+	for i, (column, value) in enumerate(runs[0]):
+		values = [ numpy.nan if parameters[i][1] is None else parameters[i][1] for parameters in runs ]
+		frame[column] = numpy.repeat(values, run_rows)
+
+	return frame[json.loads(str(arrays["report_columns"]))]
+
+def load_report(filename):
+	if filename.endswith(".npz"):
+		return load_npz_report(filename)
+
+	return pandas.read_csv(filename, sep=";", index_col="step")
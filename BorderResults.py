@@ -0,0 +1,186 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import sqlite3
+
+import numpy
+import pandas
+
+# Results store
+# -------------
+# A SQLite database which keeps the data collector frame of every finished run, so overlapping sweeps (e.g. stage 2
+# and 3 of the ethnocentrism theory, which share 0.90 - 1.00) only simulate a run once. Every run is identified by a
+# key: a hash of all model parameters, the iteration, max_steps, the sphere file contents and the code version.
+#
+#   runs            one row per run (key, parameters as JSON, seed, iteration, max_steps, code version, wall time)
+#   run_parameters  one row per run and parameter, indexed on (name, value) for lookups by parameter value
+#   run_steps       the run's frame, one compressed numpy array per column
+#
+# Runs are only reused if the code is exactly the same: changing any Border*.py file starts with a clean slate.
+
+# Parameters which do not influence the results of a run
+KEY_EXCLUDED_PARAMETERS = [ "shared_data", "route_tables", "route_cache" ]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY,
+								 key TEXT UNIQUE NOT NULL,
+								 parameters TEXT NOT NULL,
+								 seed INTEGER,
+								 iteration INTEGER NOT NULL,
+								 max_steps INTEGER NOT NULL,
+								 code_version TEXT NOT NULL,
+								 sweep TEXT,
+								 seconds REAL);
+CREATE TABLE IF NOT EXISTS run_parameters (run_id INTEGER NOT NULL REFERENCES runs(id),
+										   name TEXT NOT NULL,
+										   value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS run_parameters_index ON run_parameters (name, value, run_id);
+CREATE INDEX IF NOT EXISTS runs_code_version ON runs (code_version, max_steps);
+CREATE TABLE IF NOT EXISTS run_steps (run_id INTEGER PRIMARY KEY REFERENCES runs(id),
+									  columns TEXT NOT NULL,
+									  data BLOB NOT NULL);
+"""
+
+# Hash of the model code, so results of older code are never mistaken for results of the current code
+def code_version():
+	digest = hashlib.sha256()
+	for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Border*.py"))):
+		with open(filename, "rb") as code_file:
+			digest.update(os.path.basename(filename).encode())
+			digest.update(code_file.read())
+
+	return digest.hexdigest()[:16]
+
+# numpy.arange values differ in the last digits between sweeps (0.9000000000000001 vs 0.9), so floats are compared
+# on 12 significant digits
+def canonical_value(value):
+	if isinstance(value, (bool, numpy.bool_)):
+		return bool(value)
+	if isinstance(value, (int, numpy.integer)):
+		return int(value)
+	if isinstance(value, (float, numpy.floating)):
+		return float("{:.12g}".format(value))
+	if isinstance(value, (list, tuple)):
+		return [ canonical_value(item) for item in value ]
+
+	return value
+
+# Parameters come straight from numpy.arange and the like, JSON only knows the plain Python types
+def plain_value(value):
+	if isinstance(value, numpy.generic):
+		return value.item()
+
+	raise TypeError("{} cannot be written as JSON".format(type(value).__name__))
+
+def canonical_parameters(job):
+	parameters = { **job["fixed_params"], **job["parameters"] }
+
+	return { name: canonical_value(value) for name, value in sorted(parameters.items()) \
+			 if name not in KEY_EXCLUDED_PARAMETERS }
+
+def file_digest(filename):
+	with open(filename, "rb") as hashed_file:
+		return hashlib.sha256(hashed_file.read()).hexdigest()[:16]
+
+def job_key(job, max_steps, version):
+	parameters = canonical_parameters(job)
+
+	# The sphere file is identified by its contents rather than its name
+	if "spheres_file" in parameters:
+		parameters["spheres_file"] = file_digest(parameters["spheres_file"])
+
+	key = json.dumps({ "parameters": parameters,
+					   "iteration": job["iteration"],
+					   "max_steps": max_steps,
+					   "code_version": version }, sort_keys=True)
+
+	return hashlib.sha256(key.encode()).hexdigest()
+
+def encode_frame(frame):
+	buffer = io.BytesIO()
+	numpy.savez_compressed(buffer, index=frame.index.to_numpy(),
+						   **{ "column{}".format(i): frame[column].to_numpy() for i, column in enumerate(frame.columns) })
+
+	return json.dumps(list(frame.columns)), buffer.getvalue()
+
+def decode_frame(columns, data):
+	arrays = numpy.load(io.BytesIO(data))
+	columns = json.loads(columns)
+
+	frame = pandas.DataFrame({ column: arrays["column{}".format(i)] for i, column in enumerate(columns) },
+							 index=arrays["index"])
+
+	return frame
+
+class ResultsStore():
+	def __init__(self, filename):
+		self.filename = filename
+		# Queue workers (see BorderQueue.py) write to the same database, so wait a while for their locks
+		self.connection = sqlite3.connect(filename, timeout=60)
+		self.connection.executescript(SCHEMA)
+		self.code_version = code_version()
+
+	def close(self):
+		self.connection.close()
+
+	def key(self, job, max_steps):
+		return job_key(job, max_steps, self.code_version)
+
+	def has_run(self, job, max_steps):
+		return self.connection.execute("SELECT 1 FROM runs WHERE key = ?", (self.key(job, max_steps),)).fetchone() is not None
+
+	def load_run(self, job, max_steps):
+		row = self.connection.execute("SELECT columns, data FROM runs JOIN run_steps ON run_steps.run_id = runs.id "
+									  "WHERE key = ?", (self.key(job, max_steps),)).fetchone()
+		if row is None:
+			raise KeyError("Run {} is not in {}".format(job["run"], self.filename))
+
+		return decode_frame(*row)
+
+	def store_run(self, job, max_steps, run_frame, sweep=None, seconds=None):
+		parameters = canonical_parameters(job)
+		columns, data = encode_frame(run_frame)
+
+		with self.connection:
+			cursor = self.connection.execute("INSERT OR IGNORE INTO runs (key, parameters, seed, iteration, max_steps, "
+											 "code_version, sweep, seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+											 (self.key(job, max_steps), json.dumps(parameters), parameters.get("seed"),
+											  job["iteration"], max_steps, self.code_version, sweep, seconds))
+			# Already stored
+			if cursor.rowcount == 0:
+				return
+
+			run_id = cursor.lastrowid
+			self.connection.executemany("INSERT INTO run_parameters (run_id, name, value) VALUES (?, ?, ?)",
+										[ (run_id, name, json.dumps(value)) for name, value in parameters.items() ])
+			self.connection.execute("INSERT INTO run_steps (run_id, columns, data) VALUES (?, ?, ?)",
+									(run_id, columns, data))
+
+	# Frames of all runs (of the current code) with the given parameter values, e.g. find_runs(ethnocentrism_be=0.95)
+	def find_runs(self, max_steps=None, **parameters):
+		query = "SELECT runs.id, runs.parameters, runs.iteration, columns, data FROM runs " \
+				"JOIN run_steps ON run_steps.run_id = runs.id WHERE code_version = ?"
+		arguments = [ self.code_version ]
+
+		if max_steps is not None:
+			query += " AND max_steps = ?"
+			arguments.append(max_steps)
+
+		for name, value in parameters.items():
+			query += " AND runs.id IN (SELECT run_id FROM run_parameters WHERE name = ? AND value = ?)"
+			arguments += [ name, json.dumps(canonical_value(value)) ]
+
+		runs = []
+		for run_id, run_parameters, iteration, columns, data in self.connection.execute(query, arguments):
+			runs.append((json.loads(run_parameters), iteration, decode_frame(columns, data)))
+
+		return runs
+
+	# (parameters, max_steps, seconds) of the most recent timed runs, of any code version (see BorderSchedule.py)
+	def run_timings(self, limit=1000):
+		query = "SELECT parameters, max_steps, seconds FROM runs WHERE seconds IS NOT NULL ORDER BY id DESC LIMIT ?"
+
+		return [ (json.loads(parameters), max_steps, seconds) for parameters, max_steps, seconds in \
+				 self.connection.execute(query, (limit,)) ]
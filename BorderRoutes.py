@@ -0,0 +1,231 @@
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
+
+import numpy
+
+# Route tables
+# ------------
+# Agents start their trips (to another sphere or back home) mostly from a cell of some sphere, so with route_tables
+# the tron paths (see BorderModel.tronPath) from every sphere cell to the centre of every sphere are traced once, when
+# the model is built, and a trip only looks its path up. Trips which start outside all spheres still trace their path
+# with tronPath.
+#
+# On its own, a lookup takes 25 microseconds against 37 for tronPath on spheres.json, and 46 against 133 on a scenario
+# with 200 spheres (longer paths). Within a running model the difference is gone (trips take well under 1% of a run),
+# while tracing the whole table takes 0.14 s for spheres.json and 11 s for 200 spheres. The tables are therefore
+# opt-in, for scenarios with long paths and many trips, best with a route cache which builds them once for many runs.
+#
+# A path goes one cell at a time towards the centre of its sphere, so every step is either a horizontal or a vertical
+# move, in a direction which follows from the start and the centre. The table keeps one bit per step (1: horizontal),
+# packed into bytes, every route starting at a new byte:
+#
+#   route_rows      for every cell (index x * height + y), its row in the table, -1 for cells outside the spheres
+#   route_lengths   for every route (index row * number of spheres + sphere index), the number of steps
+#   route_offsets   for every route, the first byte of its steps in route_steps
+#   route_steps     the packed steps of all routes
+#
+# The routes are traced in bulk with the same floating point operations as tronPath, so they are the same paths.
+# Tables can be kept in a cache directory, keyed by the grid, the spheres and the code which traces them, and are
+# mapped into memory read-only (like the shared model data, see BorderShared.py).
+
+ROUTE_ARRAYS = [ "route_rows", "route_lengths", "route_offsets", "route_steps" ]
+
+# Steps traced at once (routes times steps)
+TRACE_BATCH_STEPS = 1 << 25
+
+# tronPath goes straight to centres in the same row or column, but towards lower coordinates its path starts on the
+# start cell itself and stops one cell short of the centre. Such routes are "shifted": their cells are the cells
+# before every step.
+def shifted_routes(ax, ay, bx, by):
+	return ((ax == bx) & (by < ay)) | ((ay == by) & (bx < ax))
+
+# Tron paths from every start (ax, ay) to its target (bx, by), in the coordinates of the main axis (u) and the other
+# axis (v) of every route. Returns the steps (one row per step, one column per route, True: along the main axis) and
+# the length of every route once the cells within minimum_distance from the target are cut off.
+def trace_routes(au, av, bu, bv, minimum_distance, shifted):
+	du = numpy.sign(bu - au)
+	dv = numpy.sign(bv - av)
+	full_lengths = numpy.abs(bu - au).astype(numpy.int64) + numpy.abs(bv - av)
+
+	# The tangent of the route with its main axis, and how far the cells can stray from the ideal line
+	slope = (bv - av) / numpy.where(bu == au, 1, bu - au)
+	maxd = (1 - numpy.abs(slope)) / 2
+
+	steps = numpy.zeros((full_lengths.max(initial=0), len(au)), dtype=bool)
+	lengths = numpy.zeros(len(au), dtype=numpy.int64)
+
+	# Only cells within minimum_distance * sqrt(2) steps of the target can be within minimum_distance
+	first_checked_step = max(0, full_lengths.min(initial=0) - int(numpy.ceil(minimum_distance.max(initial=0) * 1.5)) - 2)
+	lengths[first_checked_step < full_lengths] = first_checked_step
+
+	u = au.copy()
+	v = av.copy()
+	for step in range(steps.shape[0]):
+		ideal = av + (u - au) * slope
+		along = (ideal - v) * dv < maxd
+
+		u += along * du
+		v += ~along * dv
+		steps[step] = along
+
+		# The path ends at its last cell at least minimum_distance away from the target
+		if step >= first_checked_step:
+			cell_u = u - shifted * along * du
+			cell_v = v - shifted * ~along * dv
+			far = (step < full_lengths) & (numpy.hypot(cell_u - bu, cell_v - bv) >= minimum_distance)
+			lengths[far] = step + 1
+
+	return steps, lengths
+
+# Batches of routes (in order of their length) of at most TRACE_BATCH_STEPS steps, or a single route
+def route_batches(sorted_lengths):
+	start = 0
+	while start < len(sorted_lengths):
+		end = min(len(sorted_lengths), start + max(1, TRACE_BATCH_STEPS // max(1, int(sorted_lengths[start]))))
+		while end > start + 1 and (end - start) * sorted_lengths[end - 1] > TRACE_BATCH_STEPS:
+			end = start + (end - start) // 2
+		yield start, end
+		start = end
+
+def build_route_table(width, height, influence_spheres):
+	coordinates = numpy.concatenate([ numpy.asarray(influence_sphere.coordinates, dtype=numpy.int64).reshape(-1, 2) \
+									  for influence_sphere in influence_spheres ])
+	inside = (coordinates[:, 0] >= 0) & (coordinates[:, 0] < width) & (coordinates[:, 1] >= 0) & (coordinates[:, 1] < height)
+	cells = numpy.unique(coordinates[inside, 0] * height + coordinates[inside, 1])
+
+	route_rows = numpy.full(width * height, -1, dtype=numpy.int32)
+	route_rows[cells] = numpy.arange(len(cells))
+
+	# Every cell to every sphere, in route order
+	sphere_count = len(influence_spheres)
+	ax = numpy.repeat(cells // height, sphere_count)
+	ay = numpy.repeat(cells % height, sphere_count)
+	bx = numpy.tile(numpy.array([ influence_sphere.x for influence_sphere in influence_spheres ], dtype=numpy.int64), len(cells))
+	by = numpy.tile(numpy.array([ influence_sphere.y for influence_sphere in influence_spheres ], dtype=numpy.int64), len(cells))
+	minimum_distance = numpy.tile([ influence_sphere.radius / 2 for influence_sphere in influence_spheres ], len(cells))
+
+	# Mainly horizontal routes are traced along x, all others along y (like tronPath), in int16 coordinates like the
+	# neighbourhood tables (see BorderShared.py)
+	horizontal = numpy.abs(bx - ax) > numpy.abs(by - ay)
+	au, av = numpy.where(horizontal, ax, ay).astype(numpy.int16), numpy.where(horizontal, ay, ax).astype(numpy.int16)
+	bu, bv = numpy.where(horizontal, bx, by).astype(numpy.int16), numpy.where(horizontal, by, bx).astype(numpy.int16)
+	shifted = shifted_routes(ax, ay, bx, by)
+
+	# Routes of about the same length are traced together
+	full_lengths = numpy.abs(bx - ax) + numpy.abs(by - ay)
+	order = numpy.argsort(full_lengths, kind="stable")
+
+	route_lengths = numpy.zeros(len(full_lengths), dtype=numpy.int32)
+	traced = []
+	for start, end in route_batches(full_lengths[order]):
+		routes = order[start:end]
+		steps, lengths = trace_routes(au[routes], av[routes], bu[routes], bv[routes], minimum_distance[routes], shifted[routes])
+
+		# Steps along x: along the main axis of horizontal routes, across it for the others
+		move_x = steps != ~horizontal[routes]
+		route_lengths[routes] = lengths
+		traced.append((routes, numpy.packbits(move_x, axis=0).T))
+
+	# Every route starts at a new byte, with the bytes which hold its steps
+	route_bytes = (route_lengths.astype(numpy.int64) + 7) // 8
+	route_offsets = numpy.concatenate([ [ 0 ], numpy.cumsum(route_bytes) ])
+
+	route_steps = numpy.zeros(route_offsets[-1], dtype=numpy.uint8)
+	for routes, packed in traced:
+		used = numpy.arange(packed.shape[1]) < route_bytes[routes][:, None]
+		route_steps[(route_offsets[routes][:, None] + numpy.arange(packed.shape[1]))[used]] = packed[used]
+
+	return { "route_rows": route_rows,
+			 "route_lengths": route_lengths,
+			 "route_offsets": route_offsets,
+			 "route_steps": route_steps }
+
+# Tables are only reused for the same grid, spheres and tracing code
+def route_table_key(width, height, influence_spheres):
+	from BorderModel import tronPath
+
+	digest = hashlib.sha256()
+	digest.update("{} {}".format(width, height).encode())
+	for influence_sphere in influence_spheres:
+		digest.update("{} {} {}".format(influence_sphere.x, influence_sphere.y, influence_sphere.radius).encode())
+		digest.update(numpy.asarray(influence_sphere.coordinates, dtype=numpy.int64).tobytes())
+	digest.update(inspect.getsource(tronPath).encode())
+	with open(os.path.abspath(__file__), "rb") as code_file:
+		digest.update(code_file.read())
+
+	return digest.hexdigest()[:16]
+
+def save_route_table(directory, arrays):
+	for name in ROUTE_ARRAYS:
+		numpy.save(os.path.join(directory, name + ".npy"), arrays[name])
+
+def open_route_table(directory):
+	return { name: numpy.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in ROUTE_ARRAYS }
+
+# Models in the same process with the same grid and spheres use the same table
+loaded_route_tables = {}
+
+def load_route_table(width, height, influence_spheres, cache_directory=None):
+	key = route_table_key(width, height, influence_spheres)
+
+	if key not in loaded_route_tables:
+		if cache_directory is None:
+			loaded_route_tables[key] = build_route_table(width, height, influence_spheres)
+		else:
+			directory = os.path.join(cache_directory, "routes-" + key)
+
+			if not os.path.isdir(directory):
+				os.makedirs(cache_directory, exist_ok=True)
+
+				# Written next to the cache and renamed when complete, so other processes never see half a table
+				temporary_directory = tempfile.mkdtemp(prefix="routes-", dir=cache_directory)
+				save_route_table(temporary_directory, build_route_table(width, height, influence_spheres))
+				try:
+					os.rename(temporary_directory, directory)
+				except OSError:
+					# Another process was first
+					shutil.rmtree(temporary_directory)
+
+			loaded_route_tables[key] = open_route_table(directory)
+
+	return loaded_route_tables[key]
+
+class RouteTable():
+	def __init__(self, arrays, height, sphere_count):
+		self.rows = arrays["route_rows"]
+		self.lengths = arrays["route_lengths"]
+		self.offsets = arrays["route_offsets"]
+		self.steps = arrays["route_steps"]
+		self.height = height
+		self.sphere_count = sphere_count
+
+	# The path from pos to the centre of the sphere (like tronPath), None if pos lies outside all spheres
+	def path(self, pos, influence_sphere):
+		row = int(self.rows[pos[0] * self.height + pos[1]])
+		if row < 0:
+			return None
+
+		route = row * self.sphere_count + influence_sphere.index
+		length = int(self.lengths[route])
+		if length == 0:
+			return []
+
+		# One bit per step (1: horizontal), the cells follow from the running count of horizontal and vertical steps
+		offset = int(self.offsets[route])
+		steps = numpy.unpackbits(self.steps[offset:offset + (length + 7) // 8], count=length)
+		x_steps = numpy.cumsum(steps, dtype=numpy.int64)
+		y_steps = numpy.arange(1, length + 1) - x_steps
+
+		x, y = pos
+		if shifted_routes(x, y, influence_sphere.x, influence_sphere.y):
+			# The cells of shifted routes are the cells before every step
+			x_steps -= steps
+			y_steps -= 1 - steps
+
+		dx = 1 if influence_sphere.x > x else -1
+		dy = 1 if influence_sphere.y > y else -1
+
+		return list(zip((x + dx * x_steps).tolist(), (y + dy * y_steps).tolist()))
@@ -0,0 +1,146 @@
+import argparse
+import json
+import math
+import random
+
+from BorderGeometry import border_side, distance_to_line
+
+# The sphere sound means used in the hand-written spheres.json:
+# central Dutch spheres (the Randstad) start out with the new pronunciation, all other spheres don't
+INNOVATIVE_SOUND_MEAN = 0.89
+CONSERVATIVE_SOUND_MEAN = 0.00001
+
+# Draw a population size from a heavy-tailed distribution, so we get a few large cities and many small towns
+def draw_population(rng, min_population, max_population):
+	population = min_population * rng.paretovariate(1.2)
+	return int(min(population, max_population))
+
+# A sphere can be placed if it lies completely inside the grid and on the side of the border of its country,
+# and if it does not overlap with any of the spheres which were placed before
+def can_place(sphere, spheres, width, height, border_coords):
+	x, y, radius = sphere["x"], sphere["y"], sphere["radius"]
+
+	if x - radius < 0 or x + radius > width - 1 or y - radius < 0 or y + radius > height - 1:
+		return False
+
+	if border_side(border_coords, x, y) != sphere["country"]:
+		return False
+
+	if distance_to_line(border_coords[0], border_coords[1], (x, y)) < radius:
+		return False
+
+	for other_sphere in spheres:
+		if math.hypot(x - other_sphere["x"], y - other_sphere["y"]) < radius + other_sphere["radius"]:
+			return False
+
+	return True
+
+def generate_spheres(sphere_count=9, nl_share=0.45, central_share=0.5, population_scale=1,
+					 width=100, height=240, border_heights=[ 124, 104 ],
+					 min_radius=5, max_radius=15, min_population=9, max_population=200,
+					 max_attempts=10000, seed=None):
+	rng = random.Random(seed)
+	border_coords = [ (0, border_heights[0]), (width, border_heights[1]) ]
+
+	# Every country needs at least two spheres (domestic travel needs a destination other than home)
+	nl_count = min(max(round(sphere_count * nl_share), 2), sphere_count - 2)
+	country_counts = { "The Netherlands": nl_count,
+					   "Belgium": sphere_count - nl_count }
+	if min(country_counts.values()) < 2:
+		raise ValueError("A scenario needs at least two spheres for each country")
+
+	spheres = []
+	for country, count in country_counts.items():
+		# Every country needs at least one central sphere (media influence is sampled from central spheres)
+		central_count = max(1, round(count * central_share))
+		prefix = "NL" if country == "The Netherlands" else "BE"
+
+		# Place large spheres first, they are the hardest to fit
+		populations = sorted([ draw_population(rng, min_population, max_population) for i in range(count) ], reverse=True)
+
+		for i, population in enumerate(populations):
+			# The radius grows with the square root of the population, so density is roughly constant
+			radius = min_radius + (max_radius - min_radius) * math.sqrt((population - min_population) / (max_population - min_population))
+			radius = round(radius)
+
+			central = i < central_count
+			if country == "The Netherlands" and central:
+				sound_mean = INNOVATIVE_SOUND_MEAN
+			else:
+				sound_mean = CONSERVATIVE_SOUND_MEAN
+
+			for attempt in range(max_attempts):
+				sphere = { "x": rng.randint(0, width - 1),
+						   "y": rng.randint(0, height - 1),
+						   "radius": radius,
+						   "population": max(1, round(population * population_scale)),
+						   "sound_mean": sound_mean,
+						   "name": "{}{:03d}".format(prefix, i + 1),
+						   "country": country,
+						   "central": central }
+
+				if can_place(sphere, spheres, width, height, border_coords):
+					spheres.append(sphere)
+					break
+			else:
+				raise ValueError("Could not place sphere {} after {} attempts, try fewer or smaller spheres".format(
+								 "{}{:03d}".format(prefix, i + 1), max_attempts))
+
+	return spheres
+
+# Scale an existing scenario (e.g. spheres.json) to a larger population and/or grid
+def scale_spheres(spheres, population_scale=1, grid_scale=1):
+	scaled_spheres = []
+	for sphere in spheres:
+		scaled_spheres.append({ **sphere,
+								"x": round(sphere["x"] * grid_scale),
+								"y": round(sphere["y"] * grid_scale),
+								"radius": max(1, round(sphere["radius"] * grid_scale)),
+								"population": max(1, round(sphere["population"] * population_scale)) })
+
+	return scaled_spheres
+
+def write_spheres(spheres, filename):
+	with open(filename, "w") as spheres_file:
+		json.dump(spheres, spheres_file, indent="\t")
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='BorderScenario generates sphere files for the BorderModel simulation')
+	parser.add_argument('output', type=str, help="Where should the sphere file be written?")
+	parser.add_argument('--base', type=str, help="Scale an existing sphere file (e.g. spheres.json) instead of generating random spheres")
+	parser.add_argument('--spheres', type=int, default=9, help="How many spheres should be generated? (default: 9)")
+	parser.add_argument('--nl-share', type=float, default=0.45, help="Share of the spheres which lie in The Netherlands (default: 0.45)")
+	parser.add_argument('--central-share', type=float, default=0.5, help="Share of the spheres in each country which are central (default: 0.5)")
+	parser.add_argument('--population-scale', type=float, default=1, help="Multiplier for all sphere populations (default: 1)")
+	parser.add_argument('--grid-scale', type=float, default=1, help="Multiplier for grid size, coordinates and radii when using --base (default: 1)")
+	parser.add_argument('--width', type=int, default=100, help="Grid width (default: 100)")
+	parser.add_argument('--height', type=int, default=240, help="Grid height (default: 240)")
+	parser.add_argument('--border-heights', type=int, nargs=2, default=[ 124, 104 ], help="Border heights on the left and right edge of the grid (default: 124 104)")
+	parser.add_argument('--min-radius', type=int, default=5, help="Radius of the smallest spheres (default: 5)")
+	parser.add_argument('--max-radius', type=int, default=15, help="Radius of the largest spheres (default: 15)")
+	parser.add_argument('--seed', type=int, help="Random seed, for reproducible scenarios")
+
+	args = parser.parse_args()
+
+	width = args.width
+	height = args.height
+	border_heights = args.border_heights
+
+	if args.base:
+		with open(args.base) as base_file:
+			spheres = scale_spheres(json.load(base_file), args.population_scale, args.grid_scale)
+
+		width = round(width * args.grid_scale)
+		height = round(height * args.grid_scale)
+		border_heights = [ round(border_height * args.grid_scale) for border_height in border_heights ]
+	else:
+		spheres = generate_spheres(sphere_count=args.spheres, nl_share=args.nl_share, central_share=args.central_share,
+								   population_scale=args.population_scale, width=width, height=height,
+								   border_heights=border_heights, min_radius=args.min_radius,
+								   max_radius=args.max_radius, seed=args.seed)
+
+	write_spheres(spheres, args.output)
+
+	print("Written {} spheres with {} agents to {}".format(len(spheres), sum(sphere["population"] for sphere in spheres), args.output))
+	print("Model parameters: width={}, height={}, border_heights={}, spheres_file=\"{}\"".format(width, height,
+																								 border_heights, args.output))
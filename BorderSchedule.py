@@ -0,0 +1,73 @@
+import heapq
+
+import numpy
+
+# Cost-aware scheduling
+# ---------------------
+# Runs of a sweep can differ a lot in cost (larger grids, more steps, more travel), and when the most expensive runs
+# come last, the other workers sit idle until they finish. The sweep workers take jobs in order, one at a time, so
+# handing out the jobs longest first (LPT scheduling) keeps the tail of a sweep short.
+#
+# The cost of a job is estimated from the timings of earlier runs in the results database (see BorderResults.py):
+# a least squares fit of a setup time plus max_steps times the cost of a step, where the cost of a step depends
+# linearly on every numeric parameter which varies between those runs.
+
+# Fewer timed runs than this, and there is nothing to fit
+MIN_TIMED_RUNS = 5
+
+# Parameters which do not change the cost of a run
+COST_EXCLUDED_PARAMETERS = [ "seed" ]
+
+# The parameters which can go into the fit: numbers and booleans
+def numeric_parameters(parameters):
+	return { name: float(value) for name, value in parameters.items() \
+			 if isinstance(value, (bool, int, float)) and name not in COST_EXCLUDED_PARAMETERS }
+
+class CostModel():
+	def __init__(self, names, setup_seconds, step_weights, runs):
+		self.names = names
+		self.setup_seconds = setup_seconds
+		self.step_weights = step_weights
+		self.runs = runs
+
+	def features(self, parameters):
+		parameters = numeric_parameters(parameters)
+		return [ 1 ] + [ parameters.get(name, 0) for name in self.names ]
+
+	def step_seconds(self, parameters):
+		# Extrapolating far outside the timed runs can go negative, a step always costs something
+		return max(float(numpy.dot(self.step_weights, self.features(parameters))), 1e-6)
+
+	def run_seconds(self, job, max_steps):
+		return max(self.setup_seconds, 0) + self.step_seconds({ **job["fixed_params"], **job["parameters"] }) * max_steps
+
+# timings: (parameters, max_steps, seconds) of earlier runs
+def fit_cost_model(timings):
+	timings = [ (numeric_parameters(parameters), max_steps, seconds) for parameters, max_steps, seconds in timings \
+				if seconds and max_steps ]
+	if len(timings) < MIN_TIMED_RUNS:
+		return None
+
+	# Parameters which are the same in every timed run only add to the constant
+	names = sorted({ name for parameters, max_steps, seconds in timings for name in parameters })
+	names = [ name for name in names if len({ parameters.get(name, 0) for parameters, max_steps, seconds in timings }) > 1 ]
+
+	# Columns: the setup time, then the step cost features multiplied by the number of steps
+	features = numpy.array([ [ 1 ] + [ max_steps * value for value in [ 1 ] + [ parameters.get(name, 0) for name in names ] ] \
+							 for parameters, max_steps, seconds in timings ])
+	seconds = numpy.array([ seconds for parameters, max_steps, seconds in timings ])
+
+	weights = numpy.linalg.lstsq(features, seconds, rcond=None)[0]
+
+	return CostModel(names, float(weights[0]), weights[1:], len(timings))
+
+def longest_first(jobs, costs):
+	return [ job for cost, job in sorted(zip(costs, jobs), key=lambda pair: pair[0], reverse=True) ]
+
+# Time until the last job finishes when processes workers take the jobs in order, each as soon as it is free
+def expected_makespan(costs, processes):
+	workers = [ 0 ] * min(processes, max(len(costs), 1))
+	for cost in costs:
+		heapq.heappush(workers, heapq.heappop(workers) + cost)
+
+	return max(workers)
@@ -2,9 +2,9 @@ import json
 
 from BorderCanvasGrid import CanvasGrid
 from BorderChartVisualization import ChartModule
-from mesa.visualization.ModularVisualization import ModularServer
 from mesa.visualization.UserParam import UserSettableParameter
 from BorderModel import BorderModel
+from BorderRendering import RenderingServer
 
 def agent_portrayal(agent):
     portrayal = {"Shape": "circle",
@@ -100,9 +100,10 @@ model_params = {"width": width, "height": height,
                 "init_big_inventory": UserSettableParameter('checkbox', '🏁 Agents start with big inventory', value=True),
                 "target_accel_count": UserSettableParameter('slider', '🏎️ Target acceleration', value=1, min_value=1, max_value=140, step=1)}
 
-server = ModularServer(BorderModel,
-                       [grid, chart, sound_chart, sound_repo_size_chart, avg_sound_chart],
-                       "Border Model",
-                       model_params)
+# Steps and renders in a worker thread, one frame for all viewers (see BorderRendering.py)
+server = RenderingServer(BorderModel,
+                         [grid, chart, sound_chart, sound_repo_size_chart, avg_sound_chart],
+                         "Border Model",
+                         model_params)
 server.port = 8521 # The default
 server.launch()
\ No newline at end of file
@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+
+import numpy
+
+from mesa.space import MultiGrid
+
+# Read-only model data shared between sweep workers
+# -------------------------------------------------
+# Every BorderModel in a sweep with the same grid and sphere file builds the same sphere coordinates,
+# travel probabilities, neighbourhood tables and (with route_tables) route tables (see BorderRoutes.py). The parent process builds them once and writes them to
+# .npy files, which the workers map into memory read-only. The operating system keeps a single copy
+# of the pages, however many models attach to them.
+
+MANIFEST_FILENAME = "manifest.json"
+
+# For every cell (index x * height + y), the coordinates of the cells in its neighbourhood (center included).
+# The neighbourhoods are taken from mesa itself, so they come in the same order and random choices are unaffected.
+def build_neighbourhood_table(width, height, moore):
+	grid = MultiGrid(width, height, False)
+	size = 9 if moore else 5
+
+	table = numpy.full((width * height, size, 2), -1, dtype=numpy.int16)
+	counts = numpy.zeros(width * height, dtype=numpy.int8)
+
+	for x in range(width):
+		for y in range(height):
+			neighbourhood = grid.get_neighborhood((x, y), moore=moore, include_center=True)
+			table[x * height + y, :len(neighbourhood)] = neighbourhood
+			counts[x * height + y] = len(neighbourhood)
+
+	return table, counts
+
+def publish_model_data(width, height, spheres_file="spheres.json", directory=None, route_tables=False, route_cache=None):
+	from BorderModel import InfluenceSphere, radiation_probabilities
+	from BorderRoutes import load_route_table
+
+	if directory is None:
+		directory = tempfile.mkdtemp(prefix="bordermodel-shared-")
+
+	with open(spheres_file) as spheres_json:
+		spheres = json.load(spheres_json)
+
+	influence_spheres = [ InfluenceSphere(**sphere) for sphere in spheres ]
+
+	arrays = {}
+
+	# Sphere coordinates, concatenated (sphere i owns rows offsets[i] up to offsets[i + 1])
+	arrays["sphere_coordinates"] = numpy.array([ coordinates_pair for influence_sphere in influence_spheres \
+												 for coordinates_pair in influence_sphere.coordinates ], dtype=numpy.int16)
+	arrays["sphere_offsets"] = numpy.cumsum([ 0 ] + [ len(influence_sphere.coordinates) for influence_sphere in influence_spheres ])
+
+	# Travel probabilities (source row, destination column)
+	travel_probabilities = radiation_probabilities(influence_spheres)
+	matrix = numpy.full((len(influence_spheres), len(influence_spheres)), numpy.nan)
+	for i, source in enumerate(influence_spheres):
+		for j, destination in enumerate(influence_spheres):
+			if (source.name, destination.name) in travel_probabilities:
+				matrix[i, j] = travel_probabilities[(source.name, destination.name)]
+	arrays["travel_probabilities"] = matrix
+
+	arrays["von_neumann"], arrays["von_neumann_counts"] = build_neighbourhood_table(width, height, moore=False)
+	arrays["moore"], arrays["moore_counts"] = build_neighbourhood_table(width, height, moore=True)
+
+	if route_tables:
+		arrays.update(load_route_table(width, height, influence_spheres, route_cache))
+
+	for name, array in arrays.items():
+		numpy.save(os.path.join(directory, name + ".npy"), array)
+
+	with open(os.path.join(directory, MANIFEST_FILENAME), "w") as manifest_file:
+		json.dump({ "width": width,
+					"height": height,
+					"spheres_file": os.path.abspath(spheres_file),
+					"spheres": [ influence_sphere.name for influence_sphere in influence_spheres ],
+					"arrays": list(arrays) }, manifest_file)
+
+	return directory
+
+# Dict-like view of the travel probability matrix, keyed by (source name, destination name) like BorderModel's dict
+class SharedTravelProbabilities():
+	def __init__(self, matrix, sphere_indices):
+		self.matrix = matrix
+		self.sphere_indices = sphere_indices
+
+	def __getitem__(self, key):
+		return float(self.matrix[self.sphere_indices[key[0]], self.sphere_indices[key[1]]])
+
+	def __len__(self):
+		return len(self.sphere_indices) * (len(self.sphere_indices) - 1)
+
+class SharedModelData():
+	def __init__(self, directory):
+		with open(os.path.join(directory, MANIFEST_FILENAME)) as manifest_file:
+			manifest = json.load(manifest_file)
+
+		self.directory = directory
+		self.width = manifest["width"]
+		self.height = manifest["height"]
+		self.spheres_file = manifest["spheres_file"]
+		self.sphere_indices = { name: index for index, name in enumerate(manifest["spheres"]) }
+
+		# mmap_mode="r" makes the arrays read-only views on the shared page cache
+		self.arrays = { name: numpy.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in manifest["arrays"] }
+
+		self.travel_probabilities = SharedTravelProbabilities(self.arrays["travel_probabilities"], self.sphere_indices)
+
+	def check(self, width, height, spheres_file):
+		if (width, height, os.path.abspath(spheres_file)) != (self.width, self.height, self.spheres_file):
+			raise ValueError("Shared model data in {} was built for a {}x{} grid with {}".format(self.directory, self.width,
+																								 self.height, self.spheres_file))
+
+	def sphere_coordinates(self, name):
+		index = self.sphere_indices[name]
+		offsets = self.arrays["sphere_offsets"]
+
+		return self.arrays["sphere_coordinates"][offsets[index]:offsets[index + 1]]
+
+	def neighbourhood(self, pos, moore):
+		cell = pos[0] * self.height + pos[1]
+		if moore:
+			count = self.arrays["moore_counts"][cell]
+			return list(map(tuple, self.arrays["moore"][cell, :count].tolist()))
+		else:
+			count = self.arrays["von_neumann_counts"][cell]
+			return list(map(tuple, self.arrays["von_neumann"][cell, :count].tolist()))
+
+# Models in the same process attach to the same mapping
+attached_model_data = {}
+
+def attach_model_data(directory):
+	if directory not in attached_model_data:
+		attached_model_data[directory] = SharedModelData(directory)
+
+	return attached_model_data[directory]
@@ -0,0 +1,104 @@
+import numpy
+
+from BorderModel import THE_NETHERLANDS
+
+# Batched speech
+# --------------
+# All conversations of a step at once, as array operations. The rules are the same as in BorderAgent.speak and
+# adopt_sound, but every speaker picks its listener, its sound and its filters from the state at the start of the
+# speech phase:
+#
+# - listeners are drawn from the positions after movement, any agent in the Moore neighbourhood (the speaker included)
+# - a sound is picked from the speaker's repository as it was at the start of the phase
+# - the Dutch shift check compares against the listener's mean sound at the start of the phase
+#
+# The accepted sounds are then appended to the listeners' repositories in speaker order. Agents in a neighbouring band
+# (see BorderBands.py) can be listeners too, they get their sounds through adopt_sound so their own band filters them.
+
+def speak_batched(model, speakers):
+	agents, forwarded = model.speech_listeners()
+	occupants = list(agents) + list(forwarded)
+	if not occupants:
+		return
+
+	rng = model.conversation_numpy_random
+	height = model.height
+
+	# Occupants sorted by cell, so the occupants of a cell are a contiguous slice
+	cells = numpy.fromiter((occupant.pos[0] * height + occupant.pos[1] for occupant in occupants), dtype=numpy.int64,
+						   count=len(occupants))
+	order = numpy.argsort(cells, kind="stable")
+	cell_counts = numpy.bincount(cells, minlength=model.width * height)
+	cell_starts = numpy.cumsum(cell_counts) - cell_counts
+
+	occupant_index = { id(agent): index for index, agent in enumerate(agents) }
+	speaker_indices = numpy.array([ occupant_index[id(speaker)] for speaker in speakers ], dtype=numpy.int64)
+
+	# Number of occupants in each cell of every speaker's neighbourhood (padding cells count as empty)
+	table, table_counts = model.get_neighbourhood_table(moore=True)
+	speaker_cells = cells[speaker_indices]
+	neighbourhoods = table[speaker_cells]
+	neighbourhood_cells = neighbourhoods[:, :, 0].astype(numpy.int64) * height + neighbourhoods[:, :, 1]
+	valid = numpy.arange(table.shape[1]) < table_counts[speaker_cells][:, None]
+	neighbourhood_cells = numpy.where(valid, neighbourhood_cells, 0)
+	occupancy = numpy.where(valid, cell_counts[neighbourhood_cells], 0)
+
+	# Only speakers with company speak
+	totals = occupancy.sum(axis=1)
+	talking = numpy.flatnonzero(totals > 1)
+	if len(talking) == 0:
+		return
+
+	# Pick one occupant of the neighbourhood: first the cell, then the occupant inside it
+	choices = (rng.random(len(talking)) * totals[talking]).astype(numpy.int64)
+	cumulative = occupancy[talking].cumsum(axis=1)
+	chosen_cells = (cumulative > choices[:, None]).argmax(axis=1)
+	offsets = choices - (cumulative[numpy.arange(len(talking)), chosen_cells] - occupancy[talking, chosen_cells])
+	listener_indices = order[cell_starts[neighbourhood_cells[talking, chosen_cells]] + offsets]
+
+	# Pick the spoken sounds
+	speaker_list = [ agents[index] for index in speaker_indices[talking].tolist() ]
+	lengths = numpy.fromiter((len(speaker.sound_repository) for speaker in speaker_list), dtype=numpy.int64,
+							 count=len(speaker_list))
+	sound_indices = (rng.random(len(talking)) * lengths).astype(numpy.int64).tolist()
+	stored_sounds = [ speaker.sound_repository[index] for speaker, index in zip(speaker_list, sound_indices) ]
+	sounds = numpy.array(stored_sounds, dtype=numpy.float64) / model.sound_storage.scale
+
+	speaker_countries = numpy.fromiter((speaker.country for speaker in speaker_list), dtype=numpy.int8, count=len(talking))
+
+	# Filters, for the listeners which live in this model
+	local = listener_indices < len(agents)
+	local_listeners = [ agents[index] if index < len(agents) else None for index in listener_indices.tolist() ]
+	listener_countries = numpy.array([ listener.country if listener else -1 for listener in local_listeners ], dtype=numpy.int8)
+	ethnocentrism = numpy.array([ listener.ethnocentrism if listener else 0 for listener in local_listeners ], dtype=numpy.float64)
+
+	# The higher the ethnocentrism value, the less likely an agent is to adopt the foreign variant
+	foreign = local & (speaker_countries != listener_countries)
+	rejected = foreign & (rng.random(len(talking)) < ethnocentrism)
+
+	# The Dutch shift: Dutch listeners only take over Dutch sounds which are at least their current mean
+	dutch = local & (speaker_countries == THE_NETHERLANDS) & (listener_countries == THE_NETHERLANDS)
+	dutch_listeners = numpy.unique(listener_indices[dutch])
+	means = numpy.zeros(len(occupants))
+	means[dutch_listeners] = [ model.sound_storage.total(agents[index].sound_repository) / len(agents[index].sound_repository) \
+							   for index in dutch_listeners.tolist() ]
+	rejected |= dutch & (sounds < means[listener_indices])
+
+	adoption_count = model.target_accel_count or 1
+	histograms = model.sound_histograms
+
+	for i in numpy.flatnonzero(~rejected).tolist():
+		listener = local_listeners[i]
+		if listener is None:
+			occupants[listener_indices[i]].adopt_sound(float(sounds[i]), int(speaker_countries[i]))
+			continue
+
+		count = adoption_count if dutch[i] else 1
+		for adoption_turn in range(count):
+			listener.sound_repository.append(stored_sounds[i])
+
+		if histograms:
+			histograms.add(listener.influence_sphere.index, stored_sounds[i], count)
+
+	for speaker in speaker_list:
+		speaker.has_spoken = True
@@ -0,0 +1,69 @@
+import array
+import math
+import statistics
+
+# Storage formats for sound repositories
+# --------------------------------------
+# Sounds are floats in [0, 1]. By default, every repository is a list of Python floats. The compact formats
+# store the sounds in a typed array instead, at the cost of a (bounded) rounding error on every stored sound:
+#
+#   format     bytes/sound   maximum absolute error per sound
+#   float      8 (+ float)   0 (full precision)
+#   float32    4             2^-25 (about 3.0e-8), float32 has 24 significant bits
+#   uint16     2             1 / (2 * 65535) (about 7.6e-6), fixed point k / 65535
+#   uint32     4             1 / (2 * 4294967295) (about 1.2e-10), fixed point k / 4294967295
+#
+# Means of stored sounds (the avg_sound_* and sphere_* reporters, the Dutch shift check) are off by at most the same
+# bound. Because the shift check compares against these means, a run in a compact format can take a different path
+# than the same run at full precision; BorderStorageCheck.py compares the trajectories over many seeds.
+
+STORAGE_FORMATS = { "float": (None, 1),
+					"float32": ("f", 1),
+					"uint16": ("H", 65535),
+					"uint32": ("I", 4294967295) }
+
+ERROR_BOUNDS = { "float": 0,
+				 "float32": 2 ** -25,
+				 "uint16": 1 / (2 * 65535),
+				 "uint32": 1 / (2 * 4294967295) }
+
+class SoundStorage():
+	def __init__(self, storage_format="float"):
+		if storage_format not in STORAGE_FORMATS:
+			raise ValueError("Unknown sound storage format '{}', choose from: {}".format(storage_format,
+																						", ".join(STORAGE_FORMATS)))
+
+		self.storage_format = storage_format
+		self.typecode, self.scale = STORAGE_FORMATS[storage_format]
+		self.error_bound = ERROR_BOUNDS[storage_format]
+		self.fixed_point = self.scale != 1
+
+	# A new repository holding already encoded values
+	def repository(self, values=()):
+		if self.typecode is None:
+			return list(values)
+
+		return array.array(self.typecode, values)
+
+	def encode(self, sound):
+		if self.fixed_point:
+			return round(sound * self.scale)
+
+		return sound
+
+	def decode(self, value):
+		if self.fixed_point:
+			return value / self.scale
+
+		return value
+
+	# Mean sound of a sequence of encoded values
+	def mean(self, values):
+		if self.fixed_point:
+			return statistics.mean(values) / self.scale
+
+		return statistics.mean(values)
+
+	# Sum of the sounds of a sequence of encoded values
+	def total(self, values):
+		return math.fsum(values) / self.scale
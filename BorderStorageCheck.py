@@ -0,0 +1,71 @@
+import argparse
+import sys
+
+from BorderModel import BorderModel
+from BorderStorage import STORAGE_FORMATS, SoundStorage
+
+# Compares runs in a compact sound storage format with the same runs (same seeds) at full precision
+
+parser = argparse.ArgumentParser(description='BorderStorageCheck - compare compact sound storage with full precision')
+parser.add_argument('storage_format', type=str, choices=[ storage_format for storage_format in STORAGE_FORMATS if storage_format != "float" ],
+					help='sound storage format to check')
+parser.add_argument('--seeds', type=int, default=10, help='number of seeds (runs per format)')
+parser.add_argument('--steps', type=int, default=100, help='number of steps per run')
+parser.add_argument('--width', type=int, default=100, help='grid width')
+parser.add_argument('--height', type=int, default=240, help='grid height')
+parser.add_argument('--border-heights', type=int, nargs=2, default=[ 124, 104 ], help='border heights (left, right)')
+args = parser.parse_args()
+
+COLUMNS = [ "avg_sound_nl", "avg_sound_be" ]
+
+# Bytes taken up by the sound repositories of all agents (Python floats are counted once per object)
+def repository_memory(model):
+	size = 0
+	float_ids = set()
+
+	for agent in model.schedule.agents:
+		size += sys.getsizeof(agent.sound_repository)
+		if isinstance(agent.sound_repository, list):
+			for sound in agent.sound_repository:
+				if id(sound) not in float_ids:
+					float_ids.add(id(sound))
+					size += sys.getsizeof(sound)
+
+	return size
+
+def run(storage_format, seed):
+	model = BorderModel(width=args.width,
+						height=args.height,
+						border_heights=args.border_heights,
+						init_big_inventory=True,
+						sound_storage=storage_format,
+						seed=seed)
+
+	for step in range(args.steps):
+		model.step()
+
+	return model.datacollector.get_model_vars_dataframe()[COLUMNS], repository_memory(model)
+
+error_bound = SoundStorage(args.storage_format).error_bound
+largest_differences = { column: 0 for column in COLUMNS }
+diverged_runs = 0
+
+for seed in range(args.seeds):
+	full_frame, full_memory = run("float", seed)
+	compact_frame, compact_memory = run(args.storage_format, seed)
+
+	differences = (full_frame - compact_frame).abs().max()
+	for column in COLUMNS:
+		largest_differences[column] = max(largest_differences[column], differences[column])
+
+	# The reporters are rounded to 9 decimals, so that is added to the bound
+	diverged = any(differences[column] > error_bound + 1e-9 for column in COLUMNS)
+	diverged_runs += diverged
+
+	print("seed {}: max difference nl {:.3g}, be {:.3g}{}, repositories {:.1f} MB -> {:.1f} MB".format(
+		seed, differences["avg_sound_nl"], differences["avg_sound_be"], " (diverged)" if diverged else "",
+		full_memory / 1e6, compact_memory / 1e6))
+
+print("{}: error bound per sound {:.3g}".format(args.storage_format, error_bound))
+print("largest differences: nl {:.3g}, be {:.3g}".format(largest_differences["avg_sound_nl"], largest_differences["avg_sound_be"]))
+print("{} of {} runs took a different path than at full precision".format(diverged_runs, args.seeds))
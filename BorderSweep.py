@@ -0,0 +1,158 @@
+import multiprocessing
+import time
+
+from BorderMemory import MemoryBudgetExceeded, check_memory_budget, current_rss_megabytes, memory_profile, start_memory_profile, stop_memory_profile, subsystem_rules
+from BorderTelemetry import failed_event, peak_rss_megabytes, progress_event, run_event, write_event
+
+# Sweep runner
+# ------------
+# Runs every parameter combination a number of times (iterations), optionally spread over several worker processes.
+# Every run is a job: a dict holding the run number, the iteration, the variable parameters and the fixed parameters.
+# A job can also name the file its sound rasters are written to (raster_file, see BorderRaster.py) and the file its
+# telemetry is appended to (telemetry_file and telemetry_interval, see BorderTelemetry.py), and ask for a memory profile
+# or set a memory budget in megabytes (memory_profile and memory_budget, see BorderMemory.py). Once a job has run, it
+# holds its wall time in seconds, its number of steps and agents, the peak memory of its process and its memory profile.
+
+# Parameters which are not written to the report
+REPORT_EXCLUDED_COLUMNS = [ "border_heights", "shared_data", "route_tables", "route_cache" ]
+
+# With seeds (one per iteration), every parameter set gets the same seed for the same iteration
+def make_jobs(parameters_list, fixed_params, iterations, seeds=None, first_run=0, first_iteration=0):
+	jobs = []
+	for parameters in parameters_list:
+		for iteration in range(first_iteration, first_iteration + iterations):
+			job_parameters = parameters
+			if seeds is not None:
+				job_parameters = { **parameters, "seed": seeds[iteration] }
+
+			jobs.append({ "run": first_run + len(jobs),
+						  "iteration": iteration,
+						  "parameters": job_parameters,
+						  "fixed_params": fixed_params })
+
+	return jobs
+
+def run_job(model_class, job, max_steps):
+	telemetry_file = job.get("telemetry_file")
+	telemetry_interval = job.get("telemetry_interval")
+	memory_budget = job.get("memory_budget")
+
+	if job.get("memory_profile"):
+		rules = subsystem_rules()
+		start_memory_profile()
+
+	# The budget covers what the run itself adds to its process
+	if memory_budget:
+		baseline_rss = current_rss_megabytes()
+
+	start = time.perf_counter()
+	interval_start = start
+	model = None
+
+	try:
+		model = model_class(**job["fixed_params"], **job["parameters"])
+
+		while model.running and model.schedule.steps < max_steps:
+			model.step()
+
+			if memory_budget:
+				check_memory_budget(memory_budget, baseline_rss)
+
+			if telemetry_file and telemetry_interval and model.schedule.steps % telemetry_interval == 0:
+				now = time.perf_counter()
+				event = progress_event(job, model.schedule.steps, now - start, telemetry_interval / (now - interval_start))
+				if job.get("memory_profile"):
+					event["memory"] = memory_profile(rules)
+
+				write_event(telemetry_file, event)
+				interval_start = time.perf_counter()
+
+		if job.get("raster_file"):
+			model.sound_rasters.save(job["raster_file"], model.border_coords)
+
+		if job.get("memory_profile"):
+			job["memory"] = memory_profile(rules)
+	except MemoryBudgetExceeded as error:
+		if telemetry_file:
+			write_event(telemetry_file, failed_event(job, model.schedule.steps, str(error)))
+		raise
+	finally:
+		if job.get("memory_profile"):
+			stop_memory_profile()
+
+		# Banded models keep their band processes around until they are closed
+		if hasattr(model, "close"):
+			model.close()
+
+	job["seconds"] = time.perf_counter() - start
+	job["steps"] = model.schedule.steps
+	job["agents"] = sum(model.whereabouts_data.values())
+	job["peak_rss_mb"] = peak_rss_megabytes()
+
+	if telemetry_file:
+		write_event(telemetry_file, run_event(job))
+
+	return model.datacollector.get_model_vars_dataframe()
+
+# Estimated duration of a job in seconds: the model setup plus the first calibration_steps steps, extrapolated to max_steps
+# (runs which stop early take less)
+def estimate_run_seconds(model_class, job, max_steps, calibration_steps=5):
+	start = time.perf_counter()
+	model = model_class(**job["fixed_params"], **job["parameters"])
+	setup_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	steps = 0
+	while model.running and steps < min(calibration_steps, max_steps):
+		model.step()
+		steps += 1
+	step_seconds = (time.perf_counter() - start) / max(steps, 1)
+
+	if hasattr(model, "close"):
+		model.close()
+
+	return setup_seconds + step_seconds * max_steps
+
+# Settings of the sweep, set once in every worker process
+worker_settings = {}
+
+def init_worker(model_class, max_steps):
+	worker_settings["model_class"] = model_class
+	worker_settings["max_steps"] = max_steps
+
+# A run which goes over its memory budget is given up, the rest of the sweep goes on without it
+def run_job_within_budget(model_class, job, max_steps):
+	try:
+		return job, run_job(model_class, job, max_steps)
+	except MemoryBudgetExceeded as error:
+		job["error"] = str(error)
+		return job, None
+
+def run_worker_job(job):
+	return run_job_within_budget(worker_settings["model_class"], job, worker_settings["max_steps"])
+
+# Yields (job, data collector frame) pairs as runs finish (not necessarily in order when running in parallel). Workers
+# take the jobs in the given order, one at a time. Runs which went over their memory budget yield no frame (None) and
+# hold the reason in job["error"].
+def run_sweep(model_class, jobs, max_steps, processes=1):
+	if processes == 1:
+		for job in jobs:
+			yield run_job_within_budget(model_class, job, max_steps)
+	else:
+		with multiprocessing.Pool(processes, initializer=init_worker, initargs=(model_class, max_steps)) as pool:
+			yield from pool.imap_unordered(run_worker_job, jobs)
+
+# Report columns which describe a job: (column name, value) pairs of the variable parameters, the run and the fixed parameters
+def report_parameters(job):
+	return [ (column.lower(), value) for column, value in \
+			 list(job["parameters"].items()) + [ ("run", job["run"]) ] + list(job["fixed_params"].items()) \
+			 if column not in REPORT_EXCLUDED_COLUMNS ]
+
+# Add the parameters of a job to its data collector frame, one column per parameter
+def job_report(job, run_frame):
+	run_frame.index.name = "step"
+
+	for column, value in report_parameters(job):
+		run_frame[column] = value
+
+	return run_frame
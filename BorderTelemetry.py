@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+import time
+
+from BorderResults import plain_value
+
+try:
+	import resource
+except ImportError:
+	# Not available on Windows
+	resource = None
+
+# Telemetry
+# ---------
+# Every run can append JSON lines to a telemetry file while it goes on (the workers of a sweep, queue workers
+# included, all append to the same file, one line per write):
+#
+#   { "event": "progress", "time", "run", "step", "seconds", "steps_per_second" }   every telemetry_interval steps
+#   { "event": "run", "time", "run", "iteration", "parameters", "steps", "seconds", "steps_per_second", "agents",
+#     "peak_rss_mb", "memory", "pid" }                                                 when the run is finished
+#   { "event": "failed", "time", "run", "iteration", "parameters", "step", "error", "pid" }  when the run went over
+#                                                                                      its memory budget
+#
+# steps_per_second of a progress line is measured over the last interval, so a run which slows down shows up before
+# it is finished. peak_rss_mb is the peak memory of the process which ran it, over its whole life so far. Runs with a
+# memory profile also report it (see BorderMemory.py), in their progress lines too.
+
+# Peak resident memory of this process in megabytes
+def peak_rss_megabytes():
+	if resource is None:
+		return None
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	# Kilobytes on Linux, bytes on macOS
+	return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def write_event(filename, event):
+	with open(filename, "a") as telemetry_file:
+		telemetry_file.write(json.dumps({ "time": time.time(), **event }, default=plain_value) + "\n")
+
+def progress_event(job, step, seconds, steps_per_second):
+	return { "event": "progress",
+			 "run": job["run"],
+			 "step": step,
+			 "seconds": seconds,
+			 "steps_per_second": steps_per_second }
+
+def run_event(job):
+	return { "event": "run",
+			 "run": job["run"],
+			 "iteration": job["iteration"],
+			 "parameters": job["parameters"],
+			 "steps": job["steps"],
+			 "seconds": job["seconds"],
+			 "steps_per_second": job["steps"] / job["seconds"] if job["seconds"] else None,
+			 "agents": job["agents"],
+			 "peak_rss_mb": job["peak_rss_mb"],
+			 "memory": job.get("memory"),
+			 "pid": os.getpid() }
+
+def failed_event(job, step, error):
+	return { "event": "failed",
+			 "run": job["run"],
+			 "iteration": job["iteration"],
+			 "parameters": job["parameters"],
+			 "step": step,
+			 "error": error,
+			 "pid": os.getpid() }
+
+def format_duration(seconds):
+	if seconds < 60:
+		return "{:.0f} s".format(seconds)
+	if seconds < 3600:
+		return "{:.1f} min".format(seconds / 60)
+
+	return "{:.1f} h".format(seconds / 3600)
+
+# The progress of a sweep on the console: runs done, throughput and the expected end, updated whenever a run
+# finishes (in place on a terminal, one line per run in a log file)
+class ProgressLine():
+	def __init__(self, total_runs):
+		self.total_runs = total_runs
+		self.done = 0
+		self.steps = 0
+		self.run_seconds = 0
+		self.start = time.time()
+		self.in_place = sys.stdout.isatty()
+		self.line_length = 0
+
+	def update(self, job):
+		self.done += 1
+
+		# Runs which went over their memory budget have no timings, and queued runs are timed by their worker
+		if "seconds" in job:
+			self.steps += job["steps"]
+			self.run_seconds += job["seconds"]
+
+		elapsed = time.time() - self.start
+		remaining = elapsed / self.done * (self.total_runs - self.done)
+
+		run_speed = ""
+		if self.run_seconds:
+			run_speed = ", {:.1f} steps/s per run".format(self.steps / self.run_seconds)
+
+		line = "Runs {}/{} ({:.0f}%), {:.1f} runs/min{}, elapsed {}, ETA {} ({})".format(
+			   self.done, self.total_runs, 100 * self.done / self.total_runs, self.done / elapsed * 60, run_speed,
+			   format_duration(elapsed), format_duration(remaining),
+			   time.strftime("%Y-%m-%d %H:%M", time.localtime(time.time() + remaining)))
+
+		if self.in_place:
+			print("\r" + line.ljust(self.line_length), end="\n" if self.done == self.total_runs else "", flush=True)
+			self.line_length = len(line)
+		else:
+			print(line, flush=True)
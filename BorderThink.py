@@ -1,33 +1,104 @@
 import numpy
-import pandas
 import argparse
+import os
+import shutil
 import sys
+import time
 
-from mesa.batchrunner import FixedBatchRunner
-from BorderModel import BorderModel
+from BorderModel import ACTIVATION_MODES, BorderModel
+from BorderAdaptive import METRICS, adaptive_sweep
+from BorderAggregate import RunAggregator
+from BorderMemory import format_memory_profile
+from BorderBands import BandedBorderModel
+from BorderDesign import SweepDefinition
+from BorderReport import REPORT_FORMATS, decimate, write_report
+from BorderQueue import JobQueue, wait_for_jobs
+from BorderResults import ResultsStore
+from BorderSchedule import expected_makespan, fit_cost_model, longest_first
+from BorderShared import publish_model_data
+from BorderStorage import STORAGE_FORMATS
+from BorderSweep import estimate_run_seconds, make_jobs, run_sweep
+from BorderTelemetry import ProgressLine
 
 # Define possibilities
 parser = argparse.ArgumentParser(description='BorderThink automates the different parameters for the BorderModel simulation')
 parser.add_argument('theory', type=str, help="Which theory do you want to test?\
-					contact - target - ethnocentrism - scaled_ethnocentrism - media")
+					contact - target - ethnocentrism - scaled_ethnocentrism - media, or a sweep file (.json, see BorderDesign.py)")
 parser.add_argument('stage', type=int, help="Which stage do you want to simulate? (there are multiple follow-up models) 1, 2 ..")
 parser.add_argument('iterations', type=int, help='How many times should each variable parameter be tested?')
 parser.add_argument('max_steps', type=int, help='What is the step ceiling for this model?')
+parser.add_argument('--spheres', type=str, default="spheres.json", help='Which sphere file should be used? (see BorderScenario.py)')
+parser.add_argument('--width', type=int, default=100, help='Grid width (default: 100)')
+parser.add_argument('--height', type=int, default=240, help='Grid height (default: 240)')
+parser.add_argument('--bands', type=int, default=1, help='Split the grid into this many horizontal bands, each simulated in its own process (see BorderBands.py)')
+parser.add_argument('--processes', type=int, default=1, help='How many runs should be simulated in parallel? (default: 1)')
+parser.add_argument('--route-tables', action='store_true', help='Trace the travel paths from every sphere cell to every sphere once per model and look trips up instead of tracing them (see BorderRoutes.py)')
+parser.add_argument('--route-cache', type=str, default=None, help='With --route-tables, keep the route tables in this directory, so they are only built once per grid and sphere file (see BorderRoutes.py)')
+parser.add_argument('--sound-storage', type=str, default="float", choices=list(STORAGE_FORMATS), help='How sound repositories are stored (see BorderStorage.py)')
+parser.add_argument('--histogram-bins', type=int, default=None, help='Also report sound quantiles, variance and bimodality per country and sphere, from histograms with this many bins (see BorderHistogram.py)')
+parser.add_argument('--raster-interval', type=int, default=None, help='Write a raster of the mean sound and agent density per cell every this many steps, one file per run (see BorderRaster.py)')
+parser.add_argument('--database', type=str, default=None, help='Keep every run in this SQLite results database and skip runs which are already in it (see BorderResults.py)')
+parser.add_argument('--report-format', type=str, choices=REPORT_FORMATS, default="csv", help='Report format: csv (text) or npz (compressed, see BorderReport.py) (default: csv)')
+parser.add_argument('--step-stride', type=int, default=1, help='Only report every this many steps (and the last step of every run) (default: 1)')
+parser.add_argument('--event-driven-travel', action='store_true', help='Draw the waiting time until the next travel, home or return event instead of rolling for it every step (see BorderModel.py)')
+parser.add_argument('--batched-movement', action='store_true', help='Move all agents before anyone speaks, drawing the steps of wandering agents in one go (see BorderModel.py)')
+parser.add_argument('--batched-speech', action='store_true', help='Hold all conversations of a step at once, after everyone has moved (see BorderSpeech.py)')
+parser.add_argument('--activation', type=str, choices=ACTIVATION_MODES, default=None, help='How agents are activated every step: random (one agent at a time), staged (everyone moves, then everyone speaks) or batches (staged within random batches) (default: random, staged with --batched-movement or --batched-speech)')
+parser.add_argument('--activation-batches', type=int, default=10, help='Number of batches for the batches activation mode (default: 10)')
+parser.add_argument('--common-random-numbers', action='store_true', help='Give every iteration its own seed, shared by all parameter sets, and a separate random number stream per model component, so parameter sets are compared on the same random numbers')
+parser.add_argument('--seed', type=int, default=0, help='Seed of the first iteration with --common-random-numbers (default: 0)')
+parser.add_argument('--adaptive', type=str, default=None, help='Adaptive sweep over this parameter: run a coarse grid over the range of the stage, then add values where the outcome changes fastest or varies most (see BorderAdaptive.py)')
+parser.add_argument('--budget', type=int, default=200, help='Total number of runs of an adaptive sweep (default: 200)')
+parser.add_argument('--coarse-points', type=int, default=11, help='Number of values in the coarse grid of an adaptive sweep (default: 11)')
+parser.add_argument('--refinements', type=int, default=2, help='Number of values added per round of an adaptive sweep (default: 2)')
+parser.add_argument('--metric', type=str, default="divergence", help='Outcome an adaptive sweep refines on: {} or any reporter (its last value) (default: divergence)'.format(", ".join(METRICS)))
+parser.add_argument('--queue', action='store_true', help='Put the runs in a queue in the --database file and wait until BorderQueue.py workers have simulated them, instead of simulating them here (see BorderQueue.py)')
+parser.add_argument('--aggregate', action='store_true', help='Write a summary report with the mean, standard deviation, 95%% confidence interval, minimum and maximum of every reporter per parameter set and step, folding in every run as it finishes, instead of a report with every run (see BorderAggregate.py)')
+parser.add_argument('--keep-runs', type=int, default=0, help='With --aggregate, also write the full report for the first this many iterations of every parameter set (default: 0)')
+parser.add_argument('--telemetry', type=str, default=None, help='Append JSON lines with the progress of every run and its speed, wall time, peak memory, agents and parameters to this file (see BorderTelemetry.py)')
+parser.add_argument('--telemetry-interval', type=int, default=100, help='Steps between the progress lines of a run in the telemetry file (default: 100)')
+parser.add_argument('--memory-profile', action='store_true', help='Report the memory of every run per subsystem (sound repositories, paths, collector, grid, agents), measured with tracemalloc, which slows runs down (see BorderMemory.py)')
+parser.add_argument('--memory-budget', type=int, default=None, help='Stop a run when its process has grown by more than this many MB since the run started (imports and memory kept from earlier runs of the same worker do not count, see BorderMemory.py), and go on with the rest of the sweep')
+parser.add_argument('--dry-run', action='store_true', help='Only print the parameter sets and the cost estimate of the sweep, without running it')
+parser.add_argument('--border-heights', type=int, nargs=2, default=[ 124, 104 ], help='Border heights on the left and right edge of the grid (default: 124 104)')
 
 args = parser.parse_args()
 
 fixed_params = {
-	"width": 100,
-	"height": 240,
+	"width": args.width,
+	"height": args.height,
 	"return_chance": 0.05,
 	"home_chance": 0.005,
 	"decay_limit": 140,
 	"sound_mean_interval": 0.1,
-	"border_heights": [ 124, 104 ],
-	"init_big_inventory": True
+	"border_heights": args.border_heights,
+	"init_big_inventory": True,
+	"spheres_file": args.spheres,
+	"route_tables": args.route_tables,
+	"route_cache": args.route_cache,
+	"sound_storage": args.sound_storage,
+	"histogram_bins": args.histogram_bins,
+	"raster_interval": args.raster_interval,
+	"event_driven_travel": args.event_driven_travel,
+	"batched_movement": args.batched_movement,
+	"batched_speech": args.batched_speech,
+	"activation": args.activation,
+	"activation_batches": args.activation_batches
 }
 
-if args.theory == "contact":
+theory_name = args.theory
+
+if args.theory.endswith(".json"):
+	sweep = SweepDefinition(args.theory)
+	theory_name = sweep.name
+	parameters_list = sweep.parameters_list()
+
+	# The sweep file can also vary the model options which BorderThink fixes
+	fixed_params = { name: value for name, value in { **fixed_params, **sweep.fixed_params }.items() \
+					 if name not in parameters_list[0] }
+
+	print("Sweep file: {} ({} design, {} parameter sets)".format(args.theory, sweep.design, len(parameters_list)))
+elif args.theory == "contact":
 	fixed_params = { **fixed_params,
 					 "domestic_travel_chance_nl": 0.005,
 					 "domestic_travel_chance_be": 0.005,
@@ -169,43 +240,240 @@ else:
 	print("Argument not recognised")
 	sys.exit(0)
 
-print("Launching simulations for the '{}' theory".format(args.theory))
+print("Launching simulations for the '{}' theory".format(theory_name))
 print("Fixed parameters: {}".format(len(fixed_params)))
 print("Variable parameters: {}".format(len(parameters_list[0])))
 print("Iterations for each parameter combination: {}".format(args.iterations))
 print("Max steps: {}".format(args.max_steps))
+print("Sphere file: {}".format(args.spheres))
+
+if args.bands > 1:
+	print("Bands per model: {}".format(args.bands))
+
+	# Sweep workers are daemon processes, which cannot start band processes of their own
+	if args.processes > 1:
+		print("Bands cannot be combined with parallel runs")
+		sys.exit(0)
+
+	fixed_params["bands"] = args.bands
+	model_class = BandedBorderModel
+else:
+	model_class = BorderModel
+
+# Common random numbers: iteration i of every parameter set runs with seed + i
+seeds = None
+if args.common_random_numbers:
+	print("Common random numbers, seeds {} - {}".format(args.seed, args.seed + args.iterations - 1))
+
+	fixed_params["separate_streams"] = True
+	seeds = [ args.seed + iteration for iteration in range(args.iterations) ]
+
+# Runs which are already in the results database are not simulated again, and the timings of its runs calibrate
+# the cost model of the scheduler
+store = None
+cost_model = None
+if args.database:
+	store = ResultsStore(args.database)
+	cost_model = fit_cost_model(store.run_timings())
+
+# Cost estimate: from the cost model if there is one. Otherwise only a dry run times the setup and first steps of the
+# first run, a real sweep does not build an extra model for it (the progress line estimates the remaining time from
+# the runs which are finished) and treats all runs as equally long.
+jobs = make_jobs(parameters_list, fixed_params, args.iterations, seeds)
+run_seconds = None
+if cost_model:
+	print("Cost model fitted on {} timed runs in {}".format(cost_model.runs, args.database))
+elif args.dry_run:
+	run_seconds = estimate_run_seconds(model_class, jobs[0], args.max_steps)
+
+def job_costs(jobs):
+	if cost_model:
+		return [ cost_model.run_seconds(job, args.max_steps) for job in jobs ]
+
+	return [ run_seconds or 1 ] * len(jobs)
+
+total_runs = args.budget if args.adaptive else len(jobs)
+if cost_model or run_seconds:
+	if args.adaptive:
+		total_seconds = args.budget * numpy.mean(job_costs(jobs)) / args.processes
+	else:
+		total_seconds = expected_makespan(sorted(job_costs(jobs), reverse=True), args.processes)
+	print("Runs: {}, estimated {:.1f} min in total".format(total_runs, total_seconds / 60))
+else:
+	print("Runs: {}".format(total_runs))
+
+if args.dry_run:
+	for parameters in parameters_list:
+		print(", ".join("{}={}".format(name, value) for name, value in parameters.items()))
+	if store:
+		store.close()
+	sys.exit(0)
+
+# Queue workers can live on other hosts, they build their own model data
+if args.queue:
+	if not args.database:
+		print("A queue needs a results database (--database)")
+		sys.exit(0)
+
+	print("Queue: {}".format(args.database))
+	queue = JobQueue(args.database)
+
+# Parallel runs share the read-only model data (sphere coordinates, travel probabilities, neighbourhood and route tables),
+# published once for every grid and sphere file the runs use (a sweep file can vary them)
+shared_directories = None
+if args.processes > 1 and not args.queue:
+	print("Parallel runs: {}".format(args.processes))
+	shared_directories = {}
+
+def attach_shared_data(jobs):
+	for job in jobs:
+		job_params = { **job["fixed_params"], **job["parameters"] }
+		grid = (job_params["width"], job_params["height"], job_params["spheres_file"])
+
+		if grid not in shared_directories:
+			shared_directories[grid] = publish_model_data(*grid, route_tables=job_params.get("route_tables"),
+														  route_cache=job_params.get("route_cache"))
+		job["fixed_params"] = { **job["fixed_params"], "shared_data": shared_directories[grid] }
 
 print("Launching simulations NOW")
 
-batch_run = FixedBatchRunner(
-    BorderModel,
-    parameters_list,
-    fixed_params,
-    iterations=args.iterations,
-    max_steps=args.max_steps,
-    model_reporters={"data": lambda model: model.datacollector }
-)
+raster_directory = None
+if args.raster_interval:
+	raster_directory = "{}_stage{}_rasters".format(theory_name, args.stage)
+	os.makedirs(raster_directory, exist_ok=True)
+	print("Rasters: {}".format(raster_directory))
 
-batch_run.run_all()
+aggregator = None
+if args.aggregate:
+	aggregator = RunAggregator()
 
-print("Simulations finished. Generating report...")
+# Queued runs which failed (other than over their memory budget): the report is written from the other runs, and
+# BorderThink exits with an error afterwards
+failed_queue_runs = []
+
+# With --aggregate, every run is folded into the summary as soon as it is finished, and only the first --keep-runs
+# iterations of every parameter set are kept (the adaptive sweep needs all of them to choose its next values)
+def finish_run(finished_runs, job, run_frame):
+	if aggregator:
+		aggregator.add(job, decimate(run_frame, args.step_stride))
+		if job["iteration"] >= args.keep_runs and not args.adaptive:
+			return
+
+	finished_runs.append((job, run_frame))
+
+# Run a list of jobs, returns (job, data collector frame) pairs
+def run_jobs(jobs):
+	finished_runs = []
+
+	if raster_directory:
+		for job in jobs:
+			job["raster_file"] = os.path.join(raster_directory, "run{}.npz".format(job["run"]))
+
+	if shared_directories is not None:
+		attach_shared_data(jobs)
+
+	if args.telemetry:
+		for job in jobs:
+			job["telemetry_file"] = args.telemetry
+			job["telemetry_interval"] = args.telemetry_interval
+
+	for job in jobs:
+		job["memory_profile"] = args.memory_profile
+		job["memory_budget"] = args.memory_budget
 
-pandas_runs = []
+	if store:
+		pending_jobs = []
+		for job in jobs:
+			if store.has_run(job, args.max_steps) and (not job.get("raster_file") or os.path.exists(job["raster_file"])):
+				finish_run(finished_runs, job, store.load_run(job, args.max_steps))
+			else:
+				pending_jobs.append(job)
 
-run_data = batch_run.get_model_vars_dataframe()
-for run in run_data.iloc:
-	panda = run.data.get_model_vars_dataframe()
-	panda.index.name = "step"
+		print("Runs found in {}: {} of {}".format(args.database, len(jobs) - len(pending_jobs), len(jobs)))
+		jobs = pending_jobs
 
-	for column in run_data.columns.values:
-		if column in ["data", "border_heights"]:
+	# Longest jobs first, so no worker is left with a long job at the end
+	costs = job_costs(jobs)
+	jobs = longest_first(jobs, costs)
+	costs = sorted(costs, reverse=True)
+	if jobs and not args.queue and (cost_model or run_seconds):
+		completion_seconds = expected_makespan(costs, args.processes)
+		print("Expected completion in {:.1f} min, at {}".format(completion_seconds / 60,
+			  time.strftime("%Y-%m-%d %H:%M", time.localtime(time.time() + completion_seconds))))
+
+	if args.queue:
+		queue.enqueue(jobs, args.max_steps, sweep="{}_stage{}".format(theory_name, args.stage), priorities=costs)
+		for job, run_frame in wait_for_jobs(queue, store, jobs, args.max_steps, progress_line=ProgressLine(len(jobs)),
+											failed_runs=failed_queue_runs):
+			finish_run(finished_runs, job, run_frame)
+		return finished_runs
+
+	progress_line = ProgressLine(len(jobs))
+	for job, run_frame in run_sweep(model_class, jobs, args.max_steps, processes=args.processes):
+		progress_line.update(job)
+		if run_frame is None:
+			print("Run {} failed: {}".format(job["run"], job["error"]))
 			continue
+		if args.memory_profile:
+			print("Run {} memory: {}".format(job["run"], format_memory_profile(job["memory"])))
+
+		if store:
+			store.store_run(job, args.max_steps, run_frame, sweep="{}_stage{}".format(theory_name, args.stage),
+							seconds=job["seconds"])
+		finish_run(finished_runs, job, run_frame)
+
+	return finished_runs
+
+try:
+	if args.adaptive:
+		# The adaptive sweep covers the range of the parameter in this stage, the other parameters are taken from
+		# the first parameter set of the stage
+		stage_values = [ parameters[args.adaptive] for parameters in parameters_list ]
+		template = parameters_list[0]
+		print("Adaptive sweep over {} from {} to {}, budget {} runs".format(args.adaptive, min(stage_values),
+																		   max(stage_values), args.budget))
+
+		# Points past the first iterations get new seeds, continuing the common random numbers
+		def run_values(points, first_run):
+			jobs = []
+			for value, first_iteration, iterations in points:
+				point_seeds = None
+				if seeds is not None:
+					point_seeds = [ args.seed + iteration for iteration in range(first_iteration + iterations) ]
+				jobs += make_jobs([ { **template, args.adaptive: value } ], fixed_params, iterations, point_seeds,
+								  first_run=first_run + len(jobs), first_iteration=first_iteration)
+			return run_jobs(jobs)
+
+		finished_runs = adaptive_sweep(run_values, args.adaptive, min(stage_values), max(stage_values), args.coarse_points,
+									   args.iterations, args.budget, metric=args.metric, refinements=args.refinements)
+	else:
+		finished_runs = run_jobs(jobs)
+finally:
+	if shared_directories:
+		for shared_directory in shared_directories.values():
+			shutil.rmtree(shared_directory)
+	if store:
+		store.close()
+	if args.queue:
+		queue.close()
+
+print("Simulations finished. Generating report...")
+
+finished_runs.sort(key=lambda finished_run: finished_run[0]["run"])
 
-		panda[column.lower()] = run[column]
+if aggregator:
+	aggregator.write("{}_stage{}_summary.csv".format(theory_name, args.stage))
+	finished_runs = [ (job, run_frame) for job, run_frame in finished_runs if job["iteration"] < args.keep_runs ]
 
-	pandas_runs.append(panda)
+if finished_runs:
+	write_report(finished_runs, "{}_stage{}.{}".format(theory_name, args.stage, args.report_format),
+				 report_format=args.report_format, step_stride=args.step_stride)
+elif not aggregator:
+	print("No runs finished, there is nothing to report")
+	sys.exit(1)
 
-mother_panda = pandas.concat(pandas_runs)
-mother_panda.to_csv("{}_stage{}.csv".format(args.theory, args.stage), sep=";")
+print("Succesfully written report. Exiting...")
 
-print("Succesfully written report. Exiting...")
\ No newline at end of file
+if failed_queue_runs:
+	print("{} queued runs failed: {}".format(len(failed_queue_runs), ", ".join(str(job["run"]) for job in failed_queue_runs)))
+	sys.exit(1)
@@ -1,5 +1,5 @@
-from BorderModel import BorderModel
-from BorderModel import distance_between_points
+from BorderGeometry import ScenarioGeometry
+from BorderGeometry import distance_between_points
 
 class CsvWriter:
 	def __init__(self, filename):
@@ -14,17 +14,17 @@ class CsvWriter:
 	def close(self):
 		self.file.close()
 
-# Instantiate a model
-model = BorderModel(width=100, height=240, border_heights=[ 124, 104 ])
+# Load the scenario geometry (no agents needed to read the spheres)
+geometry = ScenarioGeometry(width=100, height=240, border_heights=[ 124, 104 ])
 
 csv_writer = CsvWriter("nl_towns.csv")
 
 # Go over every influence sphere...
-for influence_sphere in model.influence_spheres:
+for influence_sphere in geometry.spheres:
 	if influence_sphere.country == "The Netherlands":
 		distance = distance_between_points(47, influence_sphere.x, 32, influence_sphere.y)
 		sound_mean_zero = "1" if influence_sphere.sound_mean == 0 else "0"
 
 		csv_writer.write_line(influence_sphere.name, distance, sound_mean_zero)
 
-csv_writer.close()
\ No newline at end of file
+csv_writer.close()